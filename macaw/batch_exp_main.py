@@ -6,8 +6,9 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 
 from macaw.cis import CIS
 from macaw.core import mrc, retrieval
-from macaw.core.input_handler.action_detection import RequestDispatcher
+from macaw.core.input_handler.action_detection import HybridRequestDispatcher, RequestDispatcher
 from macaw.core.output_handler import naive_output_selection
+from macaw.util.logging import Logger
 
 
 class ConvSearch(CIS):
@@ -15,7 +16,11 @@ class ConvSearch(CIS):
         super().__init__(params)
         self.retrieval = retrieval.get_retrieval_model(params=self.params)
         self.qa = mrc.get_mrc_model(params=self.params)
-        self.request_dispatcher = RequestDispatcher({'retrieval': self.retrieval, 'qa': self.qa})
+        self.params['actions'] = {'retrieval': self.retrieval, 'qa': self.qa}
+        if 'intent_scorer' in self.params and self.params['intent_scorer'] is not None:
+            self.request_dispatcher = HybridRequestDispatcher(self.params)
+        else:
+            self.request_dispatcher = RequestDispatcher(self.params)
         self.output_selection = naive_output_selection.NaiveOutputProcessing({})
 
     def request_handler_func(self, conv_list):
@@ -25,21 +30,30 @@ class ConvSearch(CIS):
         output_msg = self.output_selection.get_output(conv_list, dispatcher_output)
         return output_msg
 
+    def batch_request_handler_func(self, conv_lists):
+        dispatcher_outputs = self.request_dispatcher.dispatch_many(conv_lists)
+        return [self.output_selection.get_output(conv_list, dispatcher_output)
+                for (conv_list, dispatcher_output) in zip(conv_lists, dispatcher_outputs)]
+
     def run(self):
         self.interface.run()
 
 
 if __name__ == '__main__':
     basic_params = {'timeout': -1,  # timeout is in terms of second.
-                    'mode': 'exp'}  # mode can be either live or exp.
+                    'mode': 'exp',  # mode can be either live or exp.
+                    'logger': Logger({})}  # for logging into file, pass the filepath to the Logger class.
     interface_params = {'interface': 'fileio',
                         'input_file_path': 'INPUT_FILE',
                         'output_file_path': 'OUTPUT_FILE',
-                        'output_format': 'text'}
+                        'output_format': 'text',
+                        'batch_size': 1000}  # number of input lines dispatched together.
     retrieval_params = {'query_generation': 'simple',
-                        'search_engine': 'bing',  # 'bing' or 'indri'
+                        'search_engine': 'bing',  # 'bing', 'indri', or 'native'
                         'use_coref': True,  # True, if query generator can use coreference resolution, otherwise False.
                         'bing_key': 'YOUR_BING_SUBSCRIPTION_TOKEN',  # only for Bing Web Search
+                        'web_archive_mode': None,  # only for Bing Web Search: None, 'record', or 'replay'
+                        'web_archive_path': 'PATH_TO_WEB_ARCHIVE',  # only for Bing Web Search
                         'search_engine_path': 'PATH_TO_INDRI',  # only for Indri
                         'col_index': 'PATH_TO_INDRI_INDEX',  # only for Indri
                         'col_text_format': 'trectext',  # trectext or trecweb. Only for Indri.
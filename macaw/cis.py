@@ -8,6 +8,7 @@ from abc import ABC, abstractmethod
 from func_timeout import FunctionTimedOut
 
 from macaw import interface, util
+from macaw.util import tracing
 from macaw.core.interaction_handler.user_requests_db import InteractionDB
 from macaw.core.interaction_handler.msg import Message
 
@@ -22,13 +23,17 @@ class CIS(ABC):
             params(dict): A dict containing some parameters.
         """
         self.params = params
+        tracing.configure(self.params)
         if params['mode'] == 'live':
             self.params['live_request_handler'] = self.live_request_handler
+            self.params['live_request_handler_async'] = self.live_request_handler_async
+            self.params['live_progressive_request_handler'] = self.live_progressive_request_handler
             self.msg_db = InteractionDB(host=self.params['interaction_db_host'],
                                         port=self.params['interaction_db_port'],
                                         dbname=self.params['interaction_db_name'])
         elif params['mode'] == 'exp':
             self.params['experimental_request_handler'] = self.request_handler_func
+            self.params['experimental_batch_request_handler'] = self.batch_request_handler_func
 
         self.interface = interface.get_interface(params)
         try:
@@ -40,14 +45,19 @@ class CIS(ABC):
 
     def live_request_handler(self, msg):
         try:
-            # load conversation from the database and add the current message to the database
-            conv = [msg] + self.msg_db.get_conv_history(user_id=msg.user_id, max_time=10 * 60 * 1000, max_count=10)
-            self.msg_db.insert_one(msg)
+            with tracing.request(), tracing.span('cis.live_request_handler'):
+                # load conversation from the database and add the current message to the database
+                with tracing.span('interaction_db.get_conv_history'):
+                    conv = [msg] + self.msg_db.get_conv_history(user_id=msg.user_id, max_time=10 * 60 * 1000,
+                                                                max_count=10)
+                with tracing.span('interaction_db.insert_one'):
+                    self.msg_db.insert_one(msg)
 
-            # output_msg = func_timeout(self.timeout, self.request_handler_func, args=[conv])
-            output_msg = self.request_handler_func(conv)
-            self.msg_db.insert_one(output_msg)
-            return output_msg
+                # output_msg = func_timeout(self.timeout, self.request_handler_func, args=[conv])
+                output_msg = self.request_handler_func(conv)
+                with tracing.span('interaction_db.insert_one'):
+                    self.msg_db.insert_one(output_msg)
+                return output_msg
 
         except FunctionTimedOut:
             msg_info = dict()
@@ -60,6 +70,93 @@ class CIS(ABC):
             self.msg_db.insert_one(error_msg)
             return error_msg
 
+    def live_progressive_request_handler(self, msg, output_callback):
+        """
+        The progressive counterpart of 'live_request_handler'. Instead of returning one response, it calls
+        output_callback with each response as soon as it is ready, e.g., the retrieval results first and then the
+        answer produced by the MRC model.
+
+        Args:
+            msg(Message): The message received from the user.
+            output_callback(callable): A function that is called with each response Message, e.g., to present it.
+        """
+        with tracing.request(), tracing.span('cis.live_progressive_request_handler'):
+            with tracing.span('interaction_db.get_conv_history'):
+                conv = [msg] + self.msg_db.get_conv_history(user_id=msg.user_id, max_time=10 * 60 * 1000,
+                                                            max_count=10)
+            with tracing.span('interaction_db.insert_one'):
+                self.msg_db.insert_one(msg)
+
+            def on_output(output_msg):
+                with tracing.span('interaction_db.insert_one'):
+                    self.msg_db.insert_one(output_msg)
+                output_callback(output_msg)
+
+            self.progressive_request_handler_func(conv, on_output)
+
+    def progressive_request_handler_func(self, conv_list, output_callback):
+        """
+        The progressive counterpart of 'request_handler_func'. By default, it produces a single response. CIS
+        applications that can upgrade their responses should override this method.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            output_callback(callable): A function that is called with each response Message.
+        """
+        output_callback(self.request_handler_func(conv_list))
+
+    async def live_request_handler_async(self, msg):
+        """
+        The async counterpart of 'live_request_handler'. Database calls and the request handler are awaited, so a slow
+        search engine or MRC model does not block the other conversations running on the same event loop.
+
+        Args:
+            msg(Message): The message received from the user.
+
+        Returns:
+            A response Message to be sent to the user.
+        """
+        with tracing.request(), tracing.span('cis.live_request_handler_async'):
+            # load conversation from the database and add the current message to the database
+            with tracing.span('interaction_db.get_conv_history'):
+                conv = [msg] + await self.msg_db.get_conv_history_async(user_id=msg.user_id, max_time=10 * 60 * 1000,
+                                                                        max_count=10)
+            with tracing.span('interaction_db.insert_one'):
+                await self.msg_db.insert_one_async(msg)
+
+            output_msg = await self.request_handler_func_async(conv)
+            with tracing.span('interaction_db.insert_one'):
+                await self.msg_db.insert_one_async(output_msg)
+            return output_msg
+
+    async def request_handler_func_async(self, conv_list):
+        """
+        The async counterpart of 'request_handler_func'. By default, it runs 'request_handler_func' in an executor.
+        CIS applications with an async pipeline should override this method.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+
+        Returns:
+            A response Message to be sent to the user.
+        """
+        return await util.run_in_executor(self.request_handler_func, conv_list)
+
+    def batch_request_handler_func(self, conv_lists):
+        """
+        The batch counterpart of 'request_handler_func', used in experimental mode. By default, the conversations are
+        handled one by one. CIS applications that support batched dispatching should override this method.
+
+        Args:
+            conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+
+        Returns:
+            A list of response Messages, in the same order as conv_lists.
+        """
+        return [self.request_handler_func(conv_list) for conv_list in conv_lists]
+
     # def experimental_request_handler(self, str_list):
     #     if not isinstance(str_list, list):
     #         raise Exception('The input should be a list!')
@@ -4,9 +4,53 @@ The request dispatcher module.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
-import multiprocessing
+import asyncio
+from collections import OrderedDict
+import math
+from multiprocessing.connection import wait
+import threading
+import time
+import traceback
 
 from macaw.core.input_handler import actions
+from macaw.core.input_handler.intent_scorer import get_intent_scorer
+from macaw.core.input_handler.worker_pool import ActionWorkerPool
+from macaw.core.interaction_handler.result_store import ConversationResultStore
+
+
+class ActionResultCache:
+    def __init__(self, max_size):
+        """
+        A thread-safe LRU cache for the results of cacheable actions, keyed by the action and the conversation.
+
+        Args:
+            max_size(int): The maximum number of cached results. Zero disables the cache.
+        """
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(action, conv_list):
+        return (action,) + tuple((msg.msg_info['msg_source'], msg.text) for msg in conv_list)
+
+    def get(self, action, conv_list):
+        key = self.get_key(action, conv_list)
+        with self.lock:
+            if key not in self.results:
+                return None
+            self.results.move_to_end(key)
+            return self.results[key]
+
+    def put(self, action, conv_list, result):
+        if self.max_size <= 0:
+            return
+        key = self.get_key(action, conv_list)
+        with self.lock:
+            self.results[key] = result
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
 
 
 class PreActionRequestDispatcher:
@@ -60,33 +104,57 @@ class PreActionRequestDispatcher:
 
         """
         action = self.action_detection(conv_list)
-        if action == 'retrieval':
-            return {'retrieval': actions.RetrievalAction.run(conv_list, self.params)}
-        if action == 'qa':
-            return {'qa': actions.QAAction.run(conv_list, self.params)}
-        if action == '#get_doc':
-            doc_id = ' '.join(conv_list[0].text.split(' ')[1:])
-            return {'#get_doc': actions.GetDocFromIndex.run(None, {**self.params, **{'doc_id': doc_id}})}
+        if action in actions.registered_commands:
+            command_args = ' '.join(conv_list[0].text.split(' ')[1:])
+            action_class = actions.get_command_info(action).action_class
+            return {action: action_class.run(conv_list, {**self.params, **{'command_args': command_args}})}
+        if action in actions.registered_actions:
+            return {action: actions.get_action_info(action).action_class.run(conv_list, self.params)}
 
 
 class RequestDispatcher:
     def __init__(self, params):
         """
         The main request dispatcher class. This module runs multiple actions in parallel for a pre-specified timeout and
-        returns all of the obtained results.
+        returns all of the obtained results. The actions are executed by a pool of long-lived worker processes that is
+        created once, on the first dispatch, so a dispatcher that is never used does not fork any process. The timeout
+        is a latency budget for the whole request: the results that are ready when it expires are returned, and the
+        workers running the late actions are terminated.
+        Actions are scheduled using the metadata they are registered with (see actions.register_action): cheaper
+        actions are submitted first, each action is bounded by its own timeout and maximum number of concurrent
+        executions, and the results of cacheable actions are reused.
 
         Args:
-            params(dict): A dict of parameters. Required params include 'actions' and 'timeout'.
+            params(dict): A dict of parameters. Required params include 'actions' and 'timeout'. A non-positive timeout
+            means no deadline. The parameter 'num_action_workers' is optional and determines the size of the worker
+            pool. The parameter 'action_cache_size' is optional and determines the number of cached action results
+            (default: 0, i.e., no caching). If the retrieval model opts in, the retrieved documents are kept in a
+            ConversationResultStore, whose optional parameters are described there, so that '#get_doc' clicks are
+            served from memory.
         """
         self.params = params
+        self.worker_pool = ActionWorkerPool(self.params)
+        self.action_semaphores = dict()
+        for action in (self.params['actions'] if 'actions' in self.params else []):
+            action_info = actions.get_action_info(action)
+            if action_info.max_concurrency is not None:
+                self.action_semaphores[action] = threading.BoundedSemaphore(action_info.max_concurrency)
+        self.action_cache = ActionResultCache(self.params['action_cache_size'] if 'action_cache_size' in self.params
+                                              else 0)
+        self.result_store = ConversationResultStore(self.params)
 
-    def dispatch(self, conv_list):
+    def dispatch(self, conv_list, dispatch_info=None, result_callback=None):
         """
-        The request dispatcher method. This method runs all non-command messages in parallel using multiprocessing.
+        The request dispatcher method. This method runs all non-command messages in parallel using the action worker
+        pool, until all actions finish or the request deadline is reached.
 
         Args:
             conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
             user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            dispatch_info(dict): An optional dict. If given, the list of actions that missed the request deadline or
+            their own timeout is added to this dict as 'missed_actions'.
+            result_callback(callable): An optional function that is called as result_callback(action, result) as soon
+            as each action produces a non-empty result, e.g., for sending progressive responses.
 
         Returns:
             A dict of str (i.e., action) to list of Documents (i.e., the action's result) as the response.
@@ -95,23 +163,235 @@ class RequestDispatcher:
             command = conv_list[0].text.split(' ')[0]
             return self.execute_command(conv_list, command)
 
-        action_processes = []
-        manager = multiprocessing.Manager()
-        action_results = manager.dict()
-        for action in self.params['actions']:
-            p = multiprocessing.Process(target=actions.run_action, args=[action, conv_list.copy(), self.params, action_results])
-            action_processes.append(p)
-            p.start()
+        # An action that requires the result of another dispatched action (e.g., QA needs the retrieved documents) is
+        # deferred until that result is ready, so the shared stage runs only once per request.
+        action_names = self.select_actions(conv_list, dispatch_info)
+        action_infos = sorted([actions.get_action_info(action) for action in action_names], key=lambda info: info.cost)
+        pending_actions = []  # list of (ActionInfo, action_params)
+        deferred_actions = dict()  # required action -> list of ActionInfos waiting for its result
+        for action_info in action_infos:
+            required_action = action_info.action_class.requires
+            if required_action is not None and required_action in action_names:
+                deferred_actions.setdefault(required_action, []).append(action_info)
+            else:
+                pending_actions.append((action_info, dict()))
 
-        for p in action_processes:
-            p.join()
+        action_results = dict()
+        missed_actions = []
+
+        def finish(action_info, result):
+            action_results[action_info.name] = result
+            if result_callback is not None and result:
+                result_callback(action_info.name, result)
+            for waiting_info in deferred_actions.pop(action_info.name, []):
+                if result is None:
+                    finish(waiting_info, None)
+                else:
+                    pending_actions.append((waiting_info, {action_info.name + '_results': result}))
+
+        timeout = self.params['timeout'] if 'timeout' in self.params else -1
+        deadline = time.time() + timeout if timeout > 0 else None
+        running = dict()  # worker connection -> (ActionInfo, worker, action deadline)
+        try:
+            while len(pending_actions) > 0 or len(running) > 0:
+                now = time.time()
+                if deadline is not None and now >= deadline:
+                    break
+                for conn in list(running):
+                    action_info, worker, action_deadline = running[conn]
+                    if action_deadline is not None and now >= action_deadline:
+                        del running[conn]
+                        self.cancel_action(action_info, worker)
+                        missed_actions.append(action_info.name)
+                        finish(action_info, None)
+
+                # Only block for a concurrency slot or an idle worker if this request holds none.
+                for (action_info, action_params) in list(pending_actions):
+                    if action_info.cacheable:
+                        result = self.action_cache.get(action_info.name, conv_list)
+                        if result is not None:
+                            pending_actions.remove((action_info, action_params))
+                            finish(action_info, result)
+                            continue
+                    block = len(running) == 0
+                    remaining = None if deadline is None else max(deadline - time.time(), 0)
+                    semaphore = self.action_semaphores.get(action_info.name)
+                    if semaphore is not None:
+                        acquired = semaphore.acquire(True, remaining) if block else semaphore.acquire(False)
+                        if not acquired:
+                            continue
+                    worker = self.worker_pool.acquire(block=block, timeout=remaining)
+                    if worker is None:
+                        if semaphore is not None:
+                            semaphore.release()
+                        break
+                    pending_actions.remove((action_info, action_params))
+                    worker.submit(action_info.name, conv_list, action_params)
+                    action_deadline = time.time() + action_info.timeout if action_info.timeout is not None else None
+                    running[worker.conn] = (action_info, worker, action_deadline)
+
+                if len(running) == 0:
+                    continue
+                wait_deadlines = [action_deadline for (action_info, worker, action_deadline) in running.values()
+                                  if action_deadline is not None] + ([deadline] if deadline is not None else [])
+                remaining = max(min(wait_deadlines) - time.time(), 0) if len(wait_deadlines) > 0 else None
+                for conn in wait(list(running), timeout=remaining):
+                    action_info, worker, action_deadline = running.pop(conn)
+                    if action_info.name in self.action_semaphores:
+                        self.action_semaphores[action_info.name].release()
+                    try:
+                        result = worker.get_result()
+                        self.worker_pool.release(worker)
+                    except (EOFError, OSError):
+                        self.params['logger'].warning('The worker running the action "%s" has died.', action_info.name)
+                        result = None
+                        self.worker_pool.replace(worker)
+                    if action_info.cacheable and result:
+                        self.action_cache.put(action_info.name, conv_list, result)
+                    finish(action_info, result)
+        finally:
+            # Cancelling the stragglers. This also runs if result_callback raises, so that no worker or concurrency
+            # slot is leaked.
+            for (action_info, worker, action_deadline) in running.values():
+                self.cancel_action(action_info, worker)
+        missed_actions += [action_info.name for (action_info, worker, action_deadline) in running.values()]
+        missed_actions += [action_info.name for (action_info, action_params) in pending_actions]
+        missed_actions += [info.name for waiting_infos in deferred_actions.values() for info in waiting_infos]
+        if len(missed_actions) > 0:
+            self.params['logger'].warning('The actions %s did not respond in time.', missed_actions)
+        if dispatch_info is not None:
+            dispatch_info['missed_actions'] = missed_actions
 
         candidate_outputs = dict()
         for key in action_results:
             if action_results[key]:
                 candidate_outputs[key] = action_results[key]
+        if 'retrieval' in candidate_outputs:
+            self.result_store.put(conv_list[0].user_id, candidate_outputs['retrieval'])
         return candidate_outputs
 
+    def dispatch_many(self, conv_lists):
+        """
+        The batch request dispatcher method, used in experimental mode. The non-command conversations are split into
+        chunks and each action is run on a whole chunk by one worker, so that the retrieval and MRC models can use
+        batched index lookups and predictions. Chunks are processed in parallel by the worker pool. Timeouts are not
+        applied to batches.
+
+        Args:
+            conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order. The parameter
+            'dispatch_chunk_size' is optional and determines the number of conversations per chunk. By default, the
+            conversations are evenly split between the workers. Conversations are only batched together if the same
+            actions are selected for them (see 'select_actions').
+
+        Returns:
+            A list of dicts of str (i.e., action) to list of Documents (i.e., the action's result), in the same order as
+            conv_lists.
+        """
+        outputs = [None] * len(conv_lists)
+        indices = []
+        for i in range(len(conv_lists)):
+            if conv_lists[i][0].msg_info['msg_type'] == 'command':
+                outputs[i] = self.execute_command(conv_lists[i], conv_lists[i][0].text.split(' ')[0])
+            else:
+                indices.append(i)
+        if len(indices) == 0:
+            return outputs
+
+        groups = OrderedDict()  # tuple of selected actions -> conversation indices
+        for i in indices:
+            groups.setdefault(tuple(self.select_actions(conv_lists[i])), []).append(i)
+        chunk_size = self.params['dispatch_chunk_size'] if 'dispatch_chunk_size' in self.params \
+            else math.ceil(len(indices) / self.worker_pool.num_workers)
+        chunks = []  # list of conversation indices
+        chunk_actions = []  # list of the selected actions for each chunk
+        for (action_names, group) in groups.items():
+            for i in range(0, len(group), chunk_size):
+                chunks.append(group[i:i + chunk_size])
+                chunk_actions.append(action_names)
+
+        pending_actions = []  # list of (ActionInfo, chunk ID, action_params)
+        deferred_actions = dict()  # (required action, chunk ID) -> list of ActionInfos waiting for its result
+        for chunk_id in range(len(chunks)):
+            action_infos = sorted([actions.get_action_info(action) for action in chunk_actions[chunk_id]],
+                                  key=lambda info: info.cost)
+            for action_info in action_infos:
+                required_action = action_info.action_class.requires
+                if required_action is not None and required_action in chunk_actions[chunk_id]:
+                    deferred_actions.setdefault((required_action, chunk_id), []).append(action_info)
+                else:
+                    pending_actions.append((action_info, chunk_id, dict()))
+
+        chunk_results = dict()  # (action, chunk ID) -> list of results
+        running = dict()  # worker connection -> (ActionInfo, chunk ID, worker)
+        while len(pending_actions) > 0 or len(running) > 0:
+            while len(pending_actions) > 0:
+                worker = self.worker_pool.acquire(block=len(running) == 0)
+                if worker is None:
+                    break
+                action_info, chunk_id, action_params = pending_actions.pop(0)
+                worker.submit(action_info.name, [conv_lists[i] for i in chunks[chunk_id]], action_params, batched=True)
+                running[worker.conn] = (action_info, chunk_id, worker)
+
+            for conn in wait(list(running)):
+                action_info, chunk_id, worker = running.pop(conn)
+                try:
+                    result = worker.get_result()
+                    self.worker_pool.release(worker)
+                except (EOFError, OSError):
+                    self.params['logger'].warning('The worker running the action "%s" has died.', action_info.name)
+                    result = None
+                    self.worker_pool.replace(worker)
+                if result is None:
+                    result = [None] * len(chunks[chunk_id])
+                chunk_results[(action_info.name, chunk_id)] = result
+                for waiting_info in deferred_actions.pop((action_info.name, chunk_id), []):
+                    pending_actions.append((waiting_info, chunk_id, {action_info.name + '_results': result}))
+
+        for ((action, chunk_id), result) in chunk_results.items():
+            for (i, action_result) in zip(chunks[chunk_id], result):
+                if outputs[i] is None:
+                    outputs[i] = dict()
+                if action_result:
+                    outputs[i][action] = action_result
+        for i in indices:
+            if outputs[i] is None:
+                outputs[i] = dict()
+        return outputs
+
+    def select_actions(self, conv_list, dispatch_info=None):
+        """
+        Selects the actions that should be run for a conversation. By default, all actions are run. Dispatchers that
+        prune actions should override this method.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            dispatch_info(dict): An optional dict that information about the selection can be added to.
+
+        Returns:
+            A list of action names.
+        """
+        return list(self.params['actions'])
+
+    def cancel_action(self, action_info, worker):
+        """
+        Cancels a running action by terminating its worker. The worker is replaced in the background to keep the
+        response within the deadline.
+
+        Args:
+            action_info(actions.ActionInfo): The metadata of the running action.
+            worker(ActionWorker): The worker running the action.
+        """
+        if action_info.name in self.action_semaphores:
+            self.action_semaphores[action_info.name].release()
+        threading.Thread(target=self.worker_pool.replace, args=[worker], daemon=True).start()
+
+    def close(self):
+        """
+        Stops the action worker processes.
+        """
+        self.worker_pool.close()
+
     def execute_command(self, conv_list, command):
         """
         The command executor method.
@@ -124,8 +404,291 @@ class RequestDispatcher:
         Returns:
             A dict of str (i.e., command) to list of Documents (i.e., the action's result) as the response.
         """
-        if command == '#get_doc':
-            doc_id = ' '.join(conv_list[0].text.split(' ')[1:])
-            return {'#get_doc': actions.GetDocFromIndex.run(None, {**self.params, **{'doc_id': doc_id}})}
-        else:
-            raise Exception('Command not found!')
+        command_args = ' '.join(conv_list[0].text.split(' ')[1:])
+        action_class = actions.get_command_info(command).action_class
+        command_params = {'command_args': command_args, 'result_store': self.result_store}
+        return {command: action_class.run(conv_list, {**self.params, **command_params})}
+
+
+class ActionPruner:
+    def __init__(self, params):
+        """
+        Selects the subset of actions that is worth running for a request, using a cheap model that detects the user's
+        intent. An action is pruned if its intent score is lower than a threshold. The actions required by a selected
+        action are never pruned. The compute saved by pruning is measured by the registered costs of the pruned
+        actions. It is shared by HybridRequestDispatcher and AsyncRequestDispatcher, so both prune the same way.
+
+        Args:
+            params(dict): A dict of parameters. 'intent_scorer' is required (see intent_scorer.get_intent_scorer). The
+            parameter 'intent_threshold' is optional (default: 0.5).
+        """
+        self.params = params
+        self.intent_scorer = get_intent_scorer(self.params)
+        self.intent_threshold = self.params['intent_threshold'] if 'intent_threshold' in self.params else 0.5
+        self.total_cost = 0.
+        self.saved_cost = 0.
+        self.stats_lock = threading.Lock()
+
+    def select_actions(self, conv_list, dispatch_info=None):
+        """
+        Selects the actions whose intent scores are not lower than the threshold.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            dispatch_info(dict): An optional dict. If given, the list of pruned actions and their total cost are added
+            to this dict as 'pruned_actions' and 'saved_cost'.
+
+        Returns:
+            A list of action names.
+        """
+        action_names = list(self.params['actions'])
+        scores = self.intent_scorer.score(conv_list, action_names)
+        selected_actions = [action for action in action_names
+                            if action not in scores or scores[action] >= self.intent_threshold]
+        for action in list(selected_actions):
+            required_action = actions.get_action_info(action).action_class.requires
+            if required_action in action_names and required_action not in selected_actions:
+                selected_actions.append(required_action)
+        pruned_actions = [action for action in action_names if action not in selected_actions]
+
+        total_cost = sum(actions.get_action_info(action).cost for action in action_names)
+        saved_cost = sum([actions.get_action_info(action).cost for action in pruned_actions], 0.)
+        with self.stats_lock:
+            self.total_cost += total_cost
+            self.saved_cost += saved_cost
+        if len(pruned_actions) > 0:
+            self.params['logger'].info('Pruned the actions %s (saved cost: %.1f).', pruned_actions, saved_cost)
+        if dispatch_info is not None:
+            dispatch_info['pruned_actions'] = pruned_actions
+            dispatch_info['saved_cost'] = saved_cost
+        return selected_actions
+
+    def get_saved_cost_ratio(self):
+        """
+        Returns the fraction of the action cost that has been saved by pruning since the pruner was created.
+        """
+        with self.stats_lock:
+            return self.saved_cost / self.total_cost if self.total_cost > 0 else 0.
+
+
+class HybridRequestDispatcher(RequestDispatcher):
+    def __init__(self, params):
+        """
+        A request dispatcher that combines the pre-action and the parallel dispatching approaches. Like
+        PreActionRequestDispatcher, it uses a cheap model to detect the user's intent, but instead of a single action it
+        selects the subset of actions that is worth running (see ActionPruner), and runs them in parallel like
+        RequestDispatcher.
+
+        Args:
+            params(dict): A dict of parameters. In addition to the parameters of RequestDispatcher, 'intent_scorer' is
+            required (see intent_scorer.get_intent_scorer). The parameter 'intent_threshold' is optional (default:
+            0.5).
+        """
+        super().__init__(params)
+        self.action_pruner = ActionPruner(self.params)
+
+    def select_actions(self, conv_list, dispatch_info=None):
+        """
+        Selects the actions whose intent scores are not lower than the threshold (see ActionPruner.select_actions).
+        """
+        return self.action_pruner.select_actions(conv_list, dispatch_info)
+
+    def get_saved_cost_ratio(self):
+        """
+        Returns the fraction of the action cost that has been saved by pruning since the dispatcher was created.
+        """
+        return self.action_pruner.get_saved_cost_ratio()
+
+
+class AsyncRequestDispatcher:
+    def __init__(self, params):
+        """
+        The asyncio counterpart of RequestDispatcher, used in the async mode of the interfaces (see
+        interface.Interface.submit_request_async). The actions run on a pool of long-lived worker processes, like in
+        RequestDispatcher, and the event loop awaits their pipes instead of blocking on them. So, many concurrent
+        conversations are multiplexed on one event loop, while their actions run in parallel. An action that misses
+        the request deadline or its own timeout is cancelled by terminating its worker. The registered action metadata
+        is used as in RequestDispatcher.
+
+        Args:
+            params(dict): A dict of parameters. Required params include 'actions' and 'timeout'. A non-positive timeout
+            means no deadline. The parameters 'num_action_workers' and 'action_cache_size' are optional (see
+            RequestDispatcher). If 'intent_scorer' is set, the actions are pruned as in HybridRequestDispatcher (see
+            ActionPruner).
+        """
+        self.params = params
+        self.action_pruner = ActionPruner(self.params) \
+            if 'intent_scorer' in self.params and self.params['intent_scorer'] is not None else None
+        self.worker_pool = ActionWorkerPool(self.params)
+        self.action_semaphores = dict()
+        self.action_cache = ActionResultCache(self.params['action_cache_size'] if 'action_cache_size' in self.params
+                                              else 0)
+        self.result_store = ConversationResultStore(self.params)
+
+    async def dispatch(self, conv_list, dispatch_info=None, result_callback=None):
+        """
+        The request dispatcher coroutine. It runs all non-command messages concurrently until all actions finish or the
+        request deadline is reached.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            dispatch_info(dict): An optional dict. If given, the list of actions that missed the request deadline or
+            their own timeout is added to this dict as 'missed_actions'. The information about the pruned actions is
+            added too (see ActionPruner.select_actions).
+            result_callback(callable): An optional function that is called as result_callback(action, result) as soon
+            as each action produces a non-empty result.
+
+        Returns:
+            A dict of str (i.e., action) to list of Documents (i.e., the action's result) as the response.
+        """
+        if conv_list[0].msg_info['msg_type'] == 'command':
+            command = conv_list[0].text.split(' ')[0]
+            return await self.execute_command(conv_list, command)
+
+        tasks = dict()
+        timed_out_actions = []
+        for action in self.select_actions(conv_list, dispatch_info):
+            tasks[action] = asyncio.ensure_future(self.run_action(action, conv_list, tasks, timed_out_actions))
+            if result_callback is not None:
+                tasks[action].add_done_callback(lambda task, action=action: self.notify(task, action, result_callback))
+
+        timeout = self.params['timeout'] if 'timeout' in self.params else -1
+        done, not_done = await asyncio.wait(list(tasks.values()), timeout=timeout if timeout > 0 else None)
+        for task in not_done:
+            task.cancel()
+
+        missed_actions = timed_out_actions + [action for action in tasks if tasks[action] in not_done]
+        if len(missed_actions) > 0:
+            self.params['logger'].warning('The actions %s did not respond in time.', missed_actions)
+        if dispatch_info is not None:
+            dispatch_info['missed_actions'] = missed_actions
+
+        candidate_outputs = dict()
+        for action in tasks:
+            if tasks[action] in done and tasks[action].result():
+                candidate_outputs[action] = tasks[action].result()
+        if 'retrieval' in candidate_outputs:
+            self.result_store.put(conv_list[0].user_id, candidate_outputs['retrieval'])
+        return candidate_outputs
+
+    def select_actions(self, conv_list, dispatch_info=None):
+        """
+        Selects the actions to run for a conversation. All actions are selected, unless an intent scorer is given.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            dispatch_info(dict): An optional dict that information about the selection can be added to.
+
+        Returns:
+            A list of action names.
+        """
+        if self.action_pruner is None:
+            return list(self.params['actions'])
+        return self.action_pruner.select_actions(conv_list, dispatch_info)
+
+    @staticmethod
+    def notify(task, action, result_callback):
+        if not task.cancelled() and task.result():
+            result_callback(action, task.result())
+
+    async def run_action(self, action, conv_list, tasks, timed_out_actions):
+        """
+        Runs a single action. If the action requires the result of another dispatched action, it waits for that task
+        instead of computing the result again.
+
+        Args:
+            action(str): The action name, e.g., 'retrieval', 'qa', etc.
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            tasks(dict): A dict of action name to the asyncio task running that action for the same request.
+            timed_out_actions(list): A list that the action name is added to if the action reaches its own timeout.
+
+        Returns:
+            The action's result or None if the action failed.
+        """
+        action_info = actions.get_action_info(action)
+        action_params = dict()
+        required_action = action_info.action_class.requires
+        if required_action is not None and required_action in tasks:
+            required_result = await asyncio.shield(tasks[required_action])
+            if required_result is None:
+                return None
+            action_params = {required_action + '_results': required_result}
+
+        if action_info.cacheable:
+            result = self.action_cache.get(action, conv_list)
+            if result is not None:
+                return result
+        if action_info.max_concurrency is not None and action not in self.action_semaphores:
+            self.action_semaphores[action] = asyncio.Semaphore(action_info.max_concurrency)
+        try:
+            if action in self.action_semaphores:
+                async with self.action_semaphores[action]:
+                    result = await asyncio.wait_for(self.run_on_worker(action, conv_list, action_params),
+                                                    action_info.timeout)
+            else:
+                result = await asyncio.wait_for(self.run_on_worker(action, conv_list, action_params),
+                                                action_info.timeout)
+        except asyncio.TimeoutError:
+            timed_out_actions.append(action)
+            return None
+        except Exception:
+            traceback.print_exc()
+            return None
+        if action_info.cacheable and result:
+            self.action_cache.put(action, conv_list, result)
+        return result
+
+    async def run_on_worker(self, action, conv_list, action_params):
+        """
+        Runs an action on an idle worker of the pool and awaits its result. If the coroutine is cancelled (e.g., at the
+        request deadline), the worker is terminated and replaced in the background.
+
+        Args:
+            action(str): The action name, e.g., 'retrieval', 'qa', etc.
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            action_params(dict): A dict of request specific parameters that are added to the worker's params.
+
+        Returns:
+            The action's result or None if the action failed.
+        """
+        worker = await self.worker_pool.acquire_async()
+        try:
+            worker.submit(action, conv_list, action_params)
+            result = await worker.get_result_async()
+        except asyncio.CancelledError:
+            threading.Thread(target=self.worker_pool.replace, args=[worker], daemon=True).start()
+            raise
+        except (EOFError, OSError):
+            self.params['logger'].warning('The worker running the action "%s" has died.', action)
+            threading.Thread(target=self.worker_pool.replace, args=[worker], daemon=True).start()
+            return None
+        self.worker_pool.release(worker)
+        return result
+
+    async def execute_command(self, conv_list, command):
+        """
+        The command executor coroutine.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            command(str): A str showing the command.
+
+        Returns:
+            A dict of str (i.e., command) to list of Documents (i.e., the action's result) as the response.
+        """
+        command_args = ' '.join(conv_list[0].text.split(' ')[1:])
+        action_class = actions.get_command_info(command).action_class
+        command_params = {'command_args': command_args, 'result_store': self.result_store}
+        return {command: await action_class.run_async(conv_list, {**self.params, **command_params})}
+
+    def close(self):
+        """
+        Stops the action worker processes.
+        """
+        self.worker_pool.close()
@@ -5,11 +5,17 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
 from abc import ABC, abstractmethod
-from func_timeout import func_timeout, FunctionTimedOut
 import traceback
 
+from macaw import util
+from macaw.util import tracing
+
 
 class Action(ABC):
+    # The name of an action whose result is consumed by this action. If both actions are dispatched for the same
+    # request, the dispatcher runs the required action once and passes its result as params[requires + '_results'].
+    requires = None
+
     @staticmethod
     @abstractmethod
     def run(conv_list, params):
@@ -23,6 +29,35 @@ class Action(ABC):
         """
         pass
 
+    @classmethod
+    def run_many(cls, conv_lists, params):
+        """
+        The batch counterpart of 'run', used for experimental batch dispatching. By default, the action is run for each
+        conversation separately.
+
+        Args:
+            conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+            params(dict): A dict containing some mandatory and optional parameters.
+
+        Returns:
+            A list of action results, in the same order as the conversations.
+        """
+        return [cls.run(conv_list, params) for conv_list in conv_lists]
+
+    @classmethod
+    async def run_async(cls, conv_list, params):
+        """
+        The async counterpart of 'run', for running an action on an event loop in the current process. The
+        AsyncRequestDispatcher uses it for the commands, which run in the dispatcher process (the actions run in worker
+        processes). By default, 'run' is called in an executor.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            params(dict): A dict containing some mandatory and optional parameters.
+        """
+        return await util.run_in_executor(cls.run, conv_list, params)
+
 
 class RetrievalAction(Action):
     @staticmethod
@@ -40,24 +75,45 @@ class RetrievalAction(Action):
         """
         return params['actions']['retrieval'].get_results(conv_list)
 
+    @classmethod
+    def run_many(cls, conv_lists, params):
+        return params['actions']['retrieval'].get_results_many(conv_lists)
+
+    @staticmethod
+    async def run_async(conv_list, params):
+        return await params['actions']['retrieval'].get_results_async(conv_list)
+
 
 class GetDocFromIndex(Action):
     @staticmethod
     def run(conv_list, params):
         """
-        Getting document from the collection index.
+        Getting document from the collection index. If the document has recently been retrieved for the same
+        conversation, it is served from the conversation result store instead.
         Args:
             conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
             user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
-            params(dict): A dict containing some parameters. The parameters 'retrieval' and 'doc_id' are required.
+            params(dict): A dict containing some parameters. The parameters 'retrieval' and 'command_args' (i.e., the
+            document ID) are required. The parameter 'result_store' is optional.
 
         Returns:
             A list of Documents with a length of 1.
         """
-        return params['actions']['retrieval'].get_doc_from_index(params['doc_id'])
+        doc = GetDocFromIndex.get_doc_from_store(conv_list, params)
+        if doc is not None:
+            return [doc]
+        return params['actions']['retrieval'].get_doc_from_index(params['command_args'])
+
+    @staticmethod
+    def get_doc_from_store(conv_list, params):
+        if 'result_store' not in params or conv_list is None:
+            return None
+        return params['result_store'].get(conv_list[0].user_id, params['command_args'])
 
 
 class QAAction(Action):
+    requires = 'retrieval'
+
     @staticmethod
     def run(conv_list, params):
         """
@@ -66,24 +122,167 @@ class QAAction(Action):
             conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
             user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
             params(dict): A dict containing some parameters. The parameters 'qa' and 'doc' are required, which are the
-            MRC model and the candidate document, respectively.
+            MRC model and the candidate document, respectively. If 'retrieval_results' is given, those documents are
+            used instead of running the retrieval model again.
 
         Returns:
             A list of Documents containing the answers.
         """
 
-        doc_list = RetrievalAction.run(conv_list, params)
+        if 'retrieval_results' in params:
+            doc_list = params['retrieval_results']
+        else:
+            doc_list = RetrievalAction.run(conv_list, params)
+        return params['actions']['qa'].get_results(conv_list, QAAction.select_doc(doc_list))
+
+    @staticmethod
+    async def run_async(conv_list, params):
+        if 'retrieval_results' in params:
+            doc_list = params['retrieval_results']
+        else:
+            doc_list = await RetrievalAction.run_async(conv_list, params)
+        return await params['actions']['qa'].get_results_async(conv_list, QAAction.select_doc(doc_list))
+
+    @classmethod
+    def run_many(cls, conv_lists, params):
+        """
+        The batch question answering action. Conversations without any retrieved document get None as their result.
+        """
+        if 'retrieval_results' in params:
+            doc_lists = params['retrieval_results']
+        else:
+            doc_lists = RetrievalAction.run_many(conv_lists, params)
+        indices = [i for i in range(len(conv_lists)) if doc_lists[i]]
+        answers = params['actions']['qa'].get_results_many([conv_lists[i] for i in indices],
+                                                           [QAAction.select_doc(doc_lists[i]) for i in indices])
+        results = [None] * len(conv_lists)
+        for i, answer in zip(indices, answers):
+            results[i] = answer
+        return results
+
+    @staticmethod
+    def select_doc(doc_list):
+        """
+        Selects the document that is passed to the MRC model, i.e., the first non-empty retrieved document.
+
+        Args:
+            doc_list(list): A list of retrieved Documents.
+
+        Returns:
+            A str containing the document text.
+        """
         doc = ''
         for i in range(len(doc_list)):
             doc = doc_list[i].text
             if len(doc.strip()) > 0:
                 break
-        return params['actions']['qa'].get_results(conv_list, doc)
+        return doc
+
+
+class ActionInfo:
+    def __init__(self, name, action_class, cost, max_concurrency, timeout, cacheable):
+        """
+        The metadata of a registered action or command, used by the dispatchers for scheduling.
+
+        Args:
+            name(str): The action name (e.g., 'qa') or the command (e.g., '#get_doc').
+            action_class(type): A subclass of Action implementing the action.
+            cost(float): The expected cost of running the action, relative to the other actions.
+            max_concurrency(int): The maximum number of concurrent executions of the action across all requests. None
+            means unlimited.
+            timeout(float): The timeout of the action in seconds. None means the action is only bounded by the
+            request deadline.
+            cacheable(bool): Whether the action's result for a conversation can be reused by the dispatcher.
+        """
+        self.name = name
+        self.action_class = action_class
+        self.cost = cost
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cacheable = cacheable
+
+
+registered_actions = dict()
+registered_commands = dict()
+
+
+def register_action(name, action_class, cost=1., max_concurrency=None, timeout=None, cacheable=False):
+    """
+    Registers an action that is run by the dispatchers for non-command messages. Registering an existing name replaces
+    its metadata, e.g., register_action('qa', QAAction, cost=5., max_concurrency=2) limits DrQA to two concurrent runs.
+
+    Args:
+        name(str): The action name. This is the key used in params['actions'] and in the candidate outputs.
+        action_class(type): A subclass of Action implementing the action.
+        cost(float): The expected cost of running the action, relative to the other actions.
+        max_concurrency(int): The maximum number of concurrent executions of the action. None means unlimited.
+        timeout(float): The timeout of the action in seconds. None means the action is only bounded by the request
+        deadline.
+        cacheable(bool): Whether the action's result for a conversation can be reused by the dispatcher.
+    """
+    registered_actions[name] = ActionInfo(name, action_class, cost, max_concurrency, timeout, cacheable)
+
+
+def register_command(name, action_class, cost=1., max_concurrency=None, timeout=None, cacheable=False):
+    """
+    Registers a command, i.e., a message starting with the given name (e.g., '#get_doc'). The arguments are the same as
+    'register_action'. The text after the command name is passed to the action as params['command_args'].
+    """
+    registered_commands[name] = ActionInfo(name, action_class, cost, max_concurrency, timeout, cacheable)
+
+
+def get_action_info(action):
+    """
+    This method returns the metadata of a registered action.
+
+    Args:
+        action(str): The action name, e.g., 'retrieval', 'qa', etc.
+
+    Returns:
+        An ActionInfo.
+    """
+    if action not in registered_actions:
+        raise Exception('Unknown Action!')
+    return registered_actions[action]
+
+
+def get_command_info(command):
+    """
+    This method returns the metadata of a registered command.
+
+    Args:
+        command(str): The command, e.g., '#get_doc'.
+
+    Returns:
+        An ActionInfo.
+    """
+    if command not in registered_commands:
+        raise Exception('Command not found!')
+    return registered_commands[command]
+
+
+def run_action_many(action, conv_lists, params, return_dict):
+    """
+    This method runs the specified action for a batch of conversations.
+
+    Args:
+        action(str): The action name, e.g., 'retrieval', 'qa', etc.
+        conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+        params(dict): A dict containing some parameters.
+        return_dict(dict): A dict that the list of the action's outputs should be added to.
+    """
+    try:
+        with tracing.span('action.' + action):
+            return_dict[action] = get_action_info(action).action_class.run_many(conv_lists, params)
+    except Exception:
+        return_dict[action] = None
+        traceback.print_exc()
 
 
 def run_action(action, conv_list, params, return_dict):
     """
-    This method runs the specified action.
+    This method runs the specified action. Timeouts are enforced by the dispatcher, which terminates the worker process
+    running an action that misses the request deadline.
 
     Args:
         action(str): The action name, e.g., 'retrieval', 'qa', etc.
@@ -93,17 +292,16 @@ def run_action(action, conv_list, params, return_dict):
         return_dict(dict): A shared dict for all processes running this action. The actions' outputs should be added to
         this dict.
     """
-    if action == 'retrieval':
-        action_func = RetrievalAction.run
-    elif action == 'qa':
-        action_func = QAAction.run
-    else:
-        raise Exception('Unknown Action!')
+    action_func = get_action_info(action).action_class.run
 
     try:
-        return_dict[action] = func_timeout(params['timeout'], action_func, args=[conv_list, params])
-    except FunctionTimedOut:
-        params['logger'].warning('The action "%s" did not respond in %d seconds.', action, params['timeout'])
+        with tracing.span('action.' + action):
+            return_dict[action] = action_func(conv_list, params)
     except Exception:
         return_dict[action] = None
         traceback.print_exc()
+
+
+register_action('retrieval', RetrievalAction, cost=1., cacheable=True)
+register_action('qa', QAAction, cost=5., cacheable=True)
+register_command('#get_doc', GetDocFromIndex, cost=1.)
@@ -0,0 +1,79 @@
+"""
+Cheap intent scorers for pruning the actions of a request before dispatching.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from abc import ABC, abstractmethod
+
+
+class IntentScorer(ABC):
+    def __init__(self, params):
+        """
+        An abstract class for intent scorers. An intent scorer is a fast model that estimates, for each action, how
+        likely it is that the action's output will be used in the response. It is run before dispatching, so it should
+        be much cheaper than the actions themselves.
+
+        Args:
+            params(dict): A dict of parameters.
+        """
+        self.params = params
+
+    @abstractmethod
+    def score(self, conv_list, action_names):
+        """
+        This method scores the actions for the given conversation.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            action_names(list): A list of action names, e.g., 'retrieval', 'qa', etc.
+
+        Returns:
+            A dict of str (i.e., action) to a score in [0, 1]. The actions that are not in the dict are always run.
+        """
+        pass
+
+
+class QuestionIntentScorer(IntentScorer):
+    def __init__(self, params):
+        """
+        A rule-based intent scorer that only keeps QA for questions, i.e., the messages ending with a question mark or
+        starting with a question word. This is the same rule that NaiveOutputProcessing uses for selecting the QA
+        output, so with that output selection, pruning never changes the response.
+
+        Args:
+            params(dict): A dict of parameters. The parameter 'question_words' is optional and is a list of the words
+            that questions start with (default: what, who, when, where, and how).
+        """
+        super().__init__(params)
+        self.question_words = self.params['question_words'] if 'question_words' in self.params \
+            else ['what', 'who', 'when', 'where', 'how']
+
+    def is_question(self, text):
+        text = text.strip().lower()
+        return text.endswith('?') or any(text.startswith(word) for word in self.question_words)
+
+    def score(self, conv_list, action_names):
+        scores = dict()
+        if 'qa' in action_names:
+            scores['qa'] = 1. if self.is_question(conv_list[0].text) else 0.
+        return scores
+
+
+def get_intent_scorer(params):
+    """
+    This method returns the IntentScorer class requested in the parameter dict.
+
+    Args:
+        params(dict): A dict of parameters. In this method, the parameters 'logger' and 'intent_scorer' are required.
+        Currently, only one intent scorer (i.e., 'question') is implemented.
+
+    Returns:
+        An IntentScorer object.
+    """
+    params['logger'].info('The intent scorer for action pruning: ' + params['intent_scorer'])
+    if params['intent_scorer'] == 'question':
+        return QuestionIntentScorer(params)
+    else:
+        raise Exception('The requested intent scorer does not exist!')
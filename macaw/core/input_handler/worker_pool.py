@@ -0,0 +1,338 @@
+"""
+A pool of long-lived worker processes for running actions.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.reduction
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+from macaw.core.input_handler import actions
+from macaw.util import tracing
+
+
+def action_worker_loop(conn, params):
+    """
+    The main loop of an action worker process. It waits for tasks on the given connection, runs each of them and sends
+    back the action's result together with the tracing spans recorded while running it. A None task stops the worker.
+
+    Args:
+        conn(multiprocessing.connection.Connection): The worker side of the pipe shared with the dispatcher.
+        params(dict): A dict containing some parameters. This dict is inherited from the parent process when the worker
+        is forked, so the retrieval and MRC objects in params['actions'] are loaded only once per worker.
+    """
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+        action, conv_list, action_params, batched, request_id = task
+        return_dict = dict()
+        run_func = actions.run_action_many if batched else actions.run_action
+        with tracing.request(request_id), tracing.collect_spans() as spans:
+            run_func(action, conv_list, {**params, **action_params}, return_dict)
+        conn.send((return_dict[action] if action in return_dict else None, spans))
+    conn.close()
+
+
+def fork_server_loop(conn, params):
+    """
+    The main loop of the fork server process. The fork server is the only process that forks action workers. It has
+    a single thread, so a worker never inherits a lock (e.g., of a cache, the tracing sink or an HTTP session) held by
+    another thread of the dispatcher process at the time of the fork. For every request received on the given
+    connection, it forks a worker and sends back its pid and the dispatcher side of its pipe. A None request stops the
+    fork server.
+
+    Args:
+        conn(multiprocessing.connection.Connection): The fork server side of the pipe shared with the pool.
+        params(dict): A dict containing some parameters, inherited by the workers.
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # the exited workers are reaped by the kernel.
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        dispatcher_sock, worker_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            dispatcher_sock.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                action_worker_loop(multiprocessing.connection.Connection(worker_sock.detach()), params)
+            finally:
+                os._exit(0)
+        worker_sock.close()
+        conn.send(pid)
+        multiprocessing.reduction.send_handle(conn, dispatcher_sock.fileno(), None)
+        dispatcher_sock.close()
+    conn.close()
+
+
+class ActionWorker:
+    def __init__(self, pid, conn):
+        """
+        A single action worker process together with the dispatcher side of its pipe. The worker is forked by the fork
+        server of the pool, so it is not a child of the dispatcher process and it is controlled by its pid.
+
+        Args:
+            pid(int): The process id of the worker.
+            conn(multiprocessing.connection.Connection): The dispatcher side of the worker's pipe.
+        """
+        self.pid = pid
+        self.conn = conn
+
+    def submit(self, action, conv_list, action_params, batched=False):
+        """
+        Sends an action to the worker. The result should be collected using 'get_result'.
+
+        Args:
+            action(str): The action name, e.g., 'retrieval', 'qa', etc.
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            If batched is True, this is a list of such conversations.
+            action_params(dict): A dict of request specific parameters that are added to the worker's params.
+            batched(bool): Whether the action should be run for a batch of conversations.
+        """
+        self.conn.send((action, conv_list, action_params, batched, tracing.get_request_id()))
+
+    def get_result(self):
+        """
+        Returns the result of the last submitted action. It blocks until the result is ready and raises EOFError if
+        the worker process has died. The spans recorded by the worker are exported by the dispatcher process.
+        """
+        result, spans = self.conn.recv()
+        tracing.record_spans(spans)
+        return result
+
+    async def get_result_async(self):
+        """
+        The async counterpart of 'get_result'. The event loop waits for the worker's pipe to become readable, so it is
+        not blocked while the action is running.
+        """
+        loop = asyncio.get_event_loop()
+        ready = loop.create_future()
+        loop.add_reader(self.conn.fileno(), lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(self.conn.fileno())
+        return self.get_result()
+
+    def stop(self):
+        """
+        Asks the worker process to exit after its current task.
+        """
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.conn.close()
+
+    def is_alive(self):
+        """
+        Returns whether the worker process is still running.
+        """
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def join(self, timeout=None):
+        """
+        Waits for the worker process to exit. The worker is not a child of this process, so its pid is polled.
+
+        Args:
+            timeout(float): The maximum waiting time in seconds. None means waiting forever.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive() and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.01)
+
+    def terminate(self):
+        """
+        Kills the worker process immediately. SIGKILL is used if the process does not exit on SIGTERM.
+        """
+        for sig, timeout in [(signal.SIGTERM, 1), (signal.SIGKILL, None)]:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                break
+            self.join(timeout)
+            if not self.is_alive():
+                break
+        self.conn.close()
+
+
+class ActionWorkerPool:
+    def __init__(self, params):
+        """
+        A pool of pre-forked action workers. Workers are created once and serve all requests, so dispatching an action
+        only costs an IPC round trip instead of creating a new process per action. The pool size also bounds the number
+        of actions running concurrently. The workers are forked on the first 'acquire' (or 'start'), so a pool that is
+        never used does not create any process. All workers, including the ones replacing killed workers, are forked by
+        a single-threaded fork server process (see 'fork_server_loop'), since forking from a thread of the dispatcher
+        process could copy a lock held by one of its other threads into the worker. The fork server itself is forked
+        once, by 'start', before any worker exists.
+
+        Args:
+            params(dict): A dict of parameters. 'num_action_workers' is optional and determines the number of worker
+            processes. If not given, it is set to the number of CPUs.
+        """
+        self.params = params
+        self.context = multiprocessing.get_context('fork')
+        self.num_workers = self.params['num_action_workers'] if 'num_action_workers' in self.params \
+            else multiprocessing.cpu_count()
+        self.idle_workers = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.fork_lock = threading.Lock()  # serializes the requests sent to the fork server
+        self.fork_server = None
+        self.fork_server_conn = None
+        self.started = False
+        self.async_waiters = []  # list of (event loop, future) of the coroutines waiting in 'acquire_async'
+
+    def start(self):
+        """
+        Forks the worker processes, unless they have already been started.
+        """
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.fork_server_conn, fork_server_conn = self.context.Pipe()
+            self.fork_server = self.context.Process(target=fork_server_loop, args=[fork_server_conn, self.params],
+                                                    daemon=True)
+            self.fork_server.start()
+            fork_server_conn.close()
+        for i in range(self.num_workers):
+            self.put_idle(self.start_worker())
+
+    def start_worker(self):
+        """
+        Asks the fork server for a new worker process and adds it to the pool.
+
+        Returns:
+            An ActionWorker.
+        """
+        with self.fork_lock:
+            if self.fork_server is None:
+                raise Exception('The action worker pool has been closed!')
+            try:
+                self.fork_server_conn.send(True)
+                pid = self.fork_server_conn.recv()
+                fd = multiprocessing.reduction.recv_handle(self.fork_server_conn)
+            except (EOFError, OSError):
+                raise Exception('The fork server of the action worker pool is not running!')
+        worker = ActionWorker(pid, multiprocessing.connection.Connection(fd))
+        with self.lock:
+            self.workers.append(worker)
+        return worker
+
+    def acquire(self, block=True, timeout=None):
+        """
+        Takes an idle worker from the pool.
+
+        Args:
+            block(bool): Whether to wait for a worker to become idle.
+            timeout(float): The maximum waiting time in seconds, if block is True. None means waiting forever.
+
+        Returns:
+            An ActionWorker, or None if no worker became idle.
+        """
+        self.start()
+        try:
+            return self.idle_workers.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def acquire_async(self):
+        """
+        The async counterpart of 'acquire'. It waits for an idle worker without blocking the event loop.
+
+        Returns:
+            An ActionWorker.
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            waiter = loop.create_future()
+            with self.lock:
+                self.async_waiters.append((loop, waiter))
+            try:
+                # The waiter is added first, so a worker released in the meantime is not missed.
+                worker = self.acquire(block=False)
+                if worker is not None:
+                    return worker
+                await waiter
+            finally:
+                with self.lock:
+                    if (loop, waiter) in self.async_waiters:
+                        self.async_waiters.remove((loop, waiter))
+
+    def put_idle(self, worker):
+        """
+        Adds a worker to the idle workers and wakes up the coroutines waiting in 'acquire_async'.
+        """
+        self.idle_workers.put(worker)
+        with self.lock:
+            waiters = self.async_waiters
+            self.async_waiters = []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+
+    def release(self, worker):
+        """
+        Returns a worker to the pool after its result has been collected.
+
+        Args:
+            worker(ActionWorker): The worker taken by 'acquire'.
+        """
+        self.put_idle(worker)
+
+    def replace(self, worker):
+        """
+        Kills a worker (e.g., a crashed one or one running a late action) and adds a freshly forked worker to the pool
+        instead.
+
+        Args:
+            worker(ActionWorker): The worker taken by 'acquire'.
+        """
+        worker.terminate()
+        with self.lock:
+            if worker not in self.workers:  # the pool has been closed.
+                return
+            self.workers.remove(worker)
+        self.put_idle(self.start_worker())
+
+    def close(self):
+        """
+        Stops all worker processes.
+        """
+        with self.lock:
+            self.started = True  # a closed pool is not started again
+            workers = list(self.workers)
+            self.workers = []
+        for worker in workers:
+            worker.stop()
+        with self.fork_lock:
+            if self.fork_server is not None:
+                self.fork_server_conn.send(None)
+                self.fork_server_conn.close()
+                self.fork_server.join()
+                self.fork_server = None
+        for worker in workers:
+            worker.join()
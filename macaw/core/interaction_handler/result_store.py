@@ -0,0 +1,88 @@
+"""
+A per-conversation store for the documents presented to the users.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from collections import OrderedDict
+import threading
+import time
+import urllib.parse
+
+
+class ConversationResultStore:
+    def __init__(self, params):
+        """
+        An in-memory store that keeps the retrieved documents of each conversation for a while, so that a follow-up
+        command on them (e.g., clicking on a retrieval option, which sends '#get_doc') can be served without going back
+        to the search engine. The store is bounded both in the number of conversations and in the number of documents
+        per conversation, and the documents expire after a TTL. The store is only used if the retrieval model opts in
+        (see core.retrieval.search_engine.Retrieval.store_retrieved_docs), and passages are not stored.
+
+        Args:
+            params(dict): A dict of parameters. These are optional parameters: 'result_store_max_conversations'
+            (default: 1000), 'result_store_max_docs' which is the maximum number of documents per conversation
+            (default: 50), and 'result_store_ttl' in seconds (default: 600). The retrieval model is
+            params['actions']['retrieval'].
+        """
+        retrieval = params['actions']['retrieval'] if 'actions' in params and 'retrieval' in params['actions'] \
+            else None
+        self.enabled = getattr(retrieval, 'store_retrieved_docs', False)
+        self.max_conversations = params['result_store_max_conversations'] \
+            if 'result_store_max_conversations' in params else 1000
+        self.max_docs = params['result_store_max_docs'] if 'result_store_max_docs' in params else 50
+        self.ttl = params['result_store_ttl'] if 'result_store_ttl' in params else 600
+        self.conversations = OrderedDict()  # user_id -> OrderedDict of doc_id -> (Document, expiration time)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize_doc_id(doc_id):
+        # Interfaces may unquote the option data (e.g., URLs in Telegram buttons).
+        return urllib.parse.unquote(str(doc_id)).strip()
+
+    def put(self, user_id, docs):
+        """
+        Adds the documents presented to a user to the store.
+
+        Args:
+            user_id(str or int): The user ID, identifying the conversation.
+            docs(list): A list of Documents.
+        """
+        if not self.enabled:
+            return
+        docs = [doc for doc in docs if doc.parent_id is None]
+        expiration_time = time.time() + self.ttl
+        with self.lock:
+            conv_docs = self.conversations.pop(user_id, OrderedDict())
+            for doc in docs:
+                doc_id = self.normalize_doc_id(doc.id)
+                conv_docs.pop(doc_id, None)
+                conv_docs[doc_id] = (doc, expiration_time)
+            while len(conv_docs) > self.max_docs:
+                conv_docs.popitem(last=False)
+            self.conversations[user_id] = conv_docs
+            while len(self.conversations) > self.max_conversations:
+                self.conversations.popitem(last=False)
+
+    def get(self, user_id, doc_id):
+        """
+        Looks up a document previously presented to a user.
+
+        Args:
+            user_id(str or int): The user ID, identifying the conversation.
+            doc_id(str): The document ID.
+
+        Returns:
+            The Document, or None if it is not in the store or it has expired.
+        """
+        if not self.enabled:
+            return None
+        doc_id = self.normalize_doc_id(doc_id)
+        with self.lock:
+            if user_id not in self.conversations or doc_id not in self.conversations[user_id]:
+                return None
+            doc, expiration_time = self.conversations[user_id][doc_id]
+            if expiration_time < time.time():
+                del self.conversations[user_id][doc_id]
+                return None
+            return doc
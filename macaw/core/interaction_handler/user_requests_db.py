@@ -36,6 +36,12 @@ class InteractionDB:
             res = res.limit(max_count)
         return self.dict_list_to_msg_list(res)
 
+    async def insert_one_async(self, msg):
+        await util.run_in_executor(self.insert_one, msg)
+
+    async def get_conv_history_async(self, user_id, max_time, max_count):
+        return await util.run_in_executor(self.get_conv_history, user_id, max_time, max_count)
+
     def close(self):
         self.client.close()
 
@@ -11,6 +11,8 @@ A wrapper to the DrQA model from FAIR: https://github.com/facebookresearch/DrQA
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+from macaw import util
+from macaw.util import tracing
 from macaw.core.retrieval.doc import Document
 
 
@@ -41,6 +43,35 @@ class MRC(ABC):
         """
         pass
 
+    def get_results_many(self, conv_lists, docs):
+        """
+        The batch counterpart of 'get_results'. By default, the questions are answered one by one. MRC models that
+        support batched prediction should override this method.
+
+        Args:
+            conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+            docs(list): A list of documents, one per conversation, that potentially contain the answers.
+
+        Returns:
+            A list of lists of Documents, in the same order as the conversations.
+        """
+        return [self.get_results(conv_list, doc) for (conv_list, doc) in zip(conv_lists, docs)]
+
+    async def get_results_async(self, conv_list, doc):
+        """
+        The async counterpart of 'get_results'. MRC models are CPU-bound, so by default 'get_results' is run in an
+        executor.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            doc(Document): A document (core.retrieval.doc.Document) that potentially contains the answer.
+
+        Returns:
+            A list of Documents each containing a candidate answer and its confidence score.
+        """
+        return await util.run_in_executor(self.get_results, conv_list, doc)
+
 
 class DrQA(MRC):
     def __init__(self, params):
@@ -73,12 +104,30 @@ class DrQA(MRC):
             list is less than or equal to the parameter 'qa_results_requested'.
         """
         q = conv_list[0].text
-        predictions = self.predictor.predict(doc, q, None, self.params['qa_results_requested'])
+        with tracing.span('mrc.predict'):
+            predictions = self.predictor.predict(doc, q, None, self.params['qa_results_requested'])
         results = []
         for i, p in enumerate(predictions, 1):
             results.append(Document(None, None, p[0], p[1]))
         return results
 
+    def get_results_many(self, conv_lists, docs):
+        """
+        This method returns the answers to a batch of questions using the DrQA batched prediction.
+
+        Args:
+            conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+            docs(list): A list of documents, one per conversation, that potentially contain the answers.
+
+        Returns:
+            A list of lists of Documents each containing a candidate answer and its confidence score, in the same order
+            as the conversations.
+        """
+        batch = [(doc, conv_list[0].text, None) for (conv_list, doc) in zip(conv_lists, docs)]
+        with tracing.span('mrc.predict_batch'):
+            batch_predictions = self.predictor.predict_batch(batch, top_n=self.params['qa_results_requested'])
+        return [[Document(None, None, p[0], p[1]) for p in predictions] for predictions in batch_predictions]
+
 
 
 
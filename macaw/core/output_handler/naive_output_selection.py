@@ -36,7 +36,10 @@ class NaiveOutputProcessing(OutputProcessing):
             A str denoting the selected action. If none is selected, None is returned.
         """
         if '#get_doc' in candidate_outputs:
-            return '#get_doc'
+            # An empty result means that the requested document does not exist.
+            if len(candidate_outputs['#get_doc']) > 0 and candidate_outputs['#get_doc'][0] is not None:
+                return '#get_doc'
+            return None
         if 'qa' in candidate_outputs:
             if len(candidate_outputs['qa'][0].text) > 0:
                 if conv_list[0].text.endswith('?') \
@@ -86,7 +89,7 @@ class NaiveOutputProcessing(OutputProcessing):
             msg_info['msg_type'] = 'options'
             msg_info['msg_creator'] = 'retrieval'
             text = 'Retrieved document list (click to see the document content):'
-            msg_info['options'] = [(output.title, '#get_doc ' + output.id, output.score) for output in candidate_outputs['retrieval']]
+            msg_info['options'] = self.get_retrieval_options(candidate_outputs['retrieval'])
         elif selected_action == '#get_doc':
             msg_info['msg_type'] = 'text'
             msg_info['msg_creator'] = '#get_doc'
@@ -96,4 +99,26 @@ class NaiveOutputProcessing(OutputProcessing):
         timestamp = util.current_time_in_milliseconds()
         if timestamp <= conv[0].timestamp:
             raise Exception('There is a problem in the output timestamp!')
-        return Message(user_interface, user_id, user_info, msg_info, text, timestamp)
\ No newline at end of file
+        return Message(user_interface, user_id, user_info, msg_info, text, timestamp)
+
+    @staticmethod
+    def get_retrieval_options(docs):
+        """
+        Produces the clickable options of a retrieval result list. Each option opens its document with '#get_doc'. For
+        passages (see core.retrieval.passage), the option opens the document that the passage is taken from, and only
+        the best passage of each document is listed.
+
+        Args:
+            docs(list): A list of retrieved Documents or passages.
+
+        Returns:
+            A list of (option text, option data, score) tuples.
+        """
+        options = []
+        doc_ids = set()
+        for doc in docs:
+            doc_id = doc.parent_id if doc.parent_id is not None else doc.id
+            if doc_id not in doc_ids:
+                doc_ids.add(doc_id)
+                options.append((doc.title, '#get_doc ' + doc_id, doc.score))
+        return options
@@ -34,3 +34,18 @@ class OutputProcessing(ABC):
             A response Message to be sent to the user.
         """
         pass
+
+    async def get_output_async(self, conv, candidate_outputs):
+        """
+        The async counterpart of 'get_output'. Output selection is cheap, so by default 'get_output' is called directly.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            candidate_outputs(dict): A dict of str (i.e., action) to list of Documents (i.e., the action's result) as
+            the response.
+
+        Returns:
+            A response Message to be sent to the user.
+        """
+        return self.get_output(conv, candidate_outputs)
@@ -5,7 +5,9 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 import macaw.core.retrieval.bing_api
 import macaw.core.retrieval.indri
-from macaw.core.retrieval import search_engine, query_generation
+import macaw.core.retrieval.native
+import macaw.core.retrieval.sharded
+from macaw.core.retrieval import cache, http_cache, passage, search_engine, query_generation
 
 
 def get_retrieval_model(params):
@@ -14,9 +16,21 @@ def get_retrieval_model(params):
     Args:
         params(dict): A dict of parameters. In this method, the parameters 'logger' and 'query_generation', and
         'search_engine' are required. Based on the requested retrievel model, some more parameters may be mandatory.
-        Currently, Macaw serves two different search engines. One is based on indri (http://lemurproject.org/indri.php),
-        and the other one is the Microsoft Bing API. If you want to retrieve results from your own document collection,
-        indri is a useful search engine, otherwise you can rely on the Bing's Web search.
+        Currently, Macaw serves three different search engines. One is based on indri (http://lemurproject.org/indri.php),
+        another one is the Microsoft Bing API, and the third one ('native') is a built-in search engine that does not
+        require any installation (see core.retrieval.native). If you want to retrieve results from your own document
+        collection, indri and the native search engine are useful, otherwise you can rely on the Bing's Web search. The
+        document cache parameters (with the 'doc' prefix) and the query result cache parameters (with the 'query'
+        prefix) are optional and are described in core.retrieval.cache.get_cache. The two caches should not share a
+        SQLite file. For indri and the native search engine, 'col_index' can be a list of index shards. Then, the
+        shards are searched in parallel by a core.retrieval.sharded.ShardedRetrieval ('score_normalization' is
+        optional), and if 'remote_shards' is True, each shard runs in its own process (see
+        core.retrieval.sharded.RemoteRetrieval). 'reranker' is an optional core.retrieval.search_engine.ReRanker. If
+        'passage_mode' is True, the retrieval results are the best passages of the retrieved documents (see
+        core.retrieval.passage.PassageRanker for the parameters 'passage_length', 'passage_stride', and
+        'passages_requested'). The Bing search engine can use a persistent HTTP cache (see
+        core.retrieval.http_cache.get_http_cache for its parameters), and its HTTP traffic can be recorded and replayed
+        offline (see the 'web_archive_mode' parameter of core.retrieval.bing_api.BingWebSearch).
 
     Returns:
         A Retrieval object for document retrieval.
@@ -27,18 +41,78 @@ def get_retrieval_model(params):
     else:
         raise Exception('The requested query generation model does not exist!')
 
+    doc_cache = cache.get_cache(params, 'doc')
+    query_cache = cache.get_cache(params, 'query')
+    query_cache_negative_ttl = params['query_cache_negative_ttl'] if 'query_cache_negative_ttl' in params else 60
+    reranker = params['reranker'] if 'reranker' in params else None
+    if 'passage_mode' in params and params['passage_mode']:
+        passage_params = dict((key, params[key]) for key in ['passage_length', 'passage_stride', 'passages_requested']
+                              if key in params)
+        reranker = passage.PassageRanker({**passage_params, 'reranker': reranker})
+
     params['logger'].info('The search engine for retrieval: ' + params['search_engine'])
-    if params['search_engine'] == 'indri':
+    if params['search_engine'] in ['indri', 'native'] and isinstance(params['col_index'], list):
+        # Only the merged results are cached, and each shard keeps its own document cache.
+        shard_params = [{**params, 'col_index': index, 'query_cache': None} for index in params['col_index']]
+        if 'remote_shards' in params and params['remote_shards']:
+            shards = [macaw.core.retrieval.sharded.RemoteRetrieval(get_retrieval_model, p) for p in shard_params]
+        else:
+            shards = [get_retrieval_model(p) for p in shard_params]
+        return macaw.core.retrieval.sharded.ShardedRetrieval({'query_generation': q_generation,
+                                                              'shards': shards,
+                                                              'results_requested': params['results_requested'],
+                                                              'score_normalization': params['score_normalization']
+                                                              if 'score_normalization' in params else 'minmax',
+                                                              'query_cache': query_cache,
+                                                              'query_cache_negative_ttl': query_cache_negative_ttl,
+                                                              'reranker': reranker,
+                                                              'logger': params['logger']})
+    elif params['search_engine'] == 'indri':
         return macaw.core.retrieval.indri.Indri({'query_generation': q_generation,
                                     'indri_path': params['search_engine_path'],
                                     'index': params['col_index'],
                                     'text_format': params['col_text_format'],
+                                    'doc_store_path': params['col_doc_store'] if 'col_doc_store' in params else None,
+                                    'vocabulary_cache_dir': params['col_vocabulary_cache']
+                                    if 'col_vocabulary_cache' in params else None,
                                     'results_requested': params['results_requested'],
+                                    'doc_cache': doc_cache,
+                                    'query_cache': query_cache,
+                                    'query_cache_negative_ttl': query_cache_negative_ttl,
+                                    'reranker': reranker,
                                     'logger': params['logger']})
+    elif params['search_engine'] == 'native':
+        return macaw.core.retrieval.native.NativeSearch({'query_generation': q_generation,
+                                                         'index': params['col_index'],
+                                                         'results_requested': params['results_requested'],
+                                                         'retrieval_model': params['retrieval_model']
+                                                         if 'retrieval_model' in params else 'bm25',
+                                                         'merge_interval': params['merge_interval']
+                                                         if 'merge_interval' in params else 60,
+                                                         'max_segments': params['max_segments']
+                                                         if 'max_segments' in params else 4,
+                                                         'doc_cache': doc_cache,
+                                                         'query_cache': query_cache,
+                                                         'query_cache_negative_ttl': query_cache_negative_ttl,
+                                                         'reranker': reranker,
+                                                         'logger': params['logger']})
     elif params['search_engine'] == 'bing':
-        return macaw.core.retrieval.bing_api.BingWebSearch({'query_generation': q_generation,
+        # The optional parameters of the API client (see core.retrieval.bing_api.BingWebSearch).
+        bing_params = dict((key, params[key]) for key in ['bing_api_url', 'fetch_timeout', 'fetch_max_bytes',
+                                                          'fetch_deadline', 'fetch_snippet_fallback',
+                                                          'max_fetch_threads', 'bing_max_qps', 'bing_burst',
+                                                          'bing_max_wait', 'bing_coalesce', 'bing_lazy_pages',
+                                                          'web_archive_mode', 'web_archive_path', 'replay_latency',
+                                                          'replay_latency_jitter'] if key in params)
+        return macaw.core.retrieval.bing_api.BingWebSearch({**bing_params,
+                                            'query_generation': q_generation,
                                             'bing_key': params['bing_key'],
+                                            'http_cache': http_cache.get_http_cache(params),
                                             'results_requested': params['results_requested'],
+                                            'doc_cache': doc_cache,
+                                            'query_cache': query_cache,
+                                            'query_cache_negative_ttl': query_cache_negative_ttl,
+                                            'reranker': reranker,
                                             'logger': params['logger']})
     else:
         raise Exception('The requested retrieval model does not exist!')
\ No newline at end of file
@@ -4,12 +4,126 @@ Abstract classes for retrieval and ranking models.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import functools
+import html
+import json
+import os
+import re
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 
-from macaw.core.retrieval.doc import Document
+from macaw.core.retrieval.doc import Document, LazyDocument
+from macaw.core.retrieval.rate_limit import RequestCoalescer, TokenBucket
 from macaw.core.retrieval.search_engine import Retrieval
+from macaw.core.retrieval.web_archive import RecordingAdapter, ReplayAdapter, WebArchive, start_replay_server
+from macaw.util import tracing
 from macaw.util.text_parser import html_to_clean_text
 
+http_session = None
+http_session_pid = None
+http_session_lock = threading.Lock()
+http_adapter_factory = None
+
+
+def set_http_transport(adapter_factory):
+	"""
+	Sets the transport of the HTTP sessions, e.g., to record or replay the Web traffic (see core.retrieval.web_archive).
+	It should be called before the action worker processes are forked.
+
+	Args:
+		adapter_factory(callable): A function that gets the pool size and returns a requests.adapters.HTTPAdapter, or
+		None for the default transport.
+	"""
+	global http_session, http_adapter_factory
+	with http_session_lock:
+		http_adapter_factory = adapter_factory
+		http_session = None
+
+
+def get_http_session(pool_size=10):
+	"""
+	Returns the HTTP session of this process, with a pool of keep-alive connections. The pooled connections should not
+	be shared with a forked process, so each process (e.g., each action worker) creates its own session.
+
+	Args:
+		pool_size(int): The maximum number of connections per host. It is used when the session is created.
+
+	Returns:
+		A requests.Session.
+	"""
+	global http_session, http_session_pid
+	with http_session_lock:
+		if http_session is None or http_session_pid != os.getpid():
+			http_session = requests.Session()
+			if http_adapter_factory is not None:
+				adapter = http_adapter_factory(pool_size)
+			else:
+				adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+			http_session.mount('http://', adapter)
+			http_session.mount('https://', adapter)
+			http_session_pid = os.getpid()
+		return http_session
+
+
+def download_page(url, timeout, max_bytes, deadline, extra_headers):
+	"""
+	Downloads a Web page.
+
+	Args:
+		url(str): The page URL.
+		timeout(float): The connect and read timeouts (in seconds).
+		max_bytes(int): The maximum number of bytes read from the page. The rest of the page is ignored.
+		deadline(float): The maximum download time (in seconds). The rest of the page is ignored.
+		extra_headers(dict): Additional request headers, e.g., the validators of a conditional request.
+
+	Returns:
+		A tuple of the HTTP status code, the response headers, and the (possibly truncated) body.
+	"""
+	headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.0; WOW64; rv:24.0) Gecko/20100101 Firefox/24.0',
+			   **extra_headers}
+	end_time = time.time() + deadline
+	with get_http_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+		if response.status_code == 304:
+			return 304, dict(response.headers), b''
+		response.raise_for_status()
+		chunks = []
+		size = 0
+		for chunk in response.iter_content(chunk_size=64 * 1024):
+			chunks.append(chunk)
+			size += len(chunk)
+			if size >= max_bytes or time.time() > end_time:
+				break  # a truncated page is still useful
+		return response.status_code, dict(response.headers), b''.join(chunks)[:max_bytes]
+
+
+def download_page_text(url, timeout, max_bytes, deadline, http_cache=None):
+	"""
+	Downloads a Web page and extracts its clean text. It is a module-level function, so that it can be pickled as the
+	loader of a core.retrieval.doc.LazyDocument.
+
+	Args:
+		url(str): The page URL.
+		timeout(float): The connect and read timeouts (in seconds).
+		max_bytes(int): The maximum number of bytes read from the page. The rest of the page is ignored.
+		deadline(float): The maximum download time (in seconds). The rest of the page is ignored.
+		http_cache(core.retrieval.http_cache.HttpCache): The HTTP cache of the pages. This parameter is optional.
+
+	Returns:
+		A str containing the clean text.
+	"""
+	with tracing.span('bing.fetch_page'):
+		if http_cache is not None:
+			body = http_cache.get_page(url, lambda validators: download_page(url, timeout, max_bytes, deadline,
+																			 validators))
+		else:
+			body = download_page(url, timeout, max_bytes, deadline, {})[2]
+		return html_to_clean_text(body)
+
 
 class BingWebSearch(Retrieval):
 	def __init__(self, params):
@@ -23,13 +137,84 @@ class BingWebSearch(Retrieval):
 			'bing_key': The Bing API key.
 			'results_requested': The maximum number of requested documents for retrieval. If not given, it is set to 1.
 			Note that this is limited by the number of results returned by the API.
+			'web_doc_ttl': The time to live of the fetched Web pages in the document cache (in seconds). This parameter
+			is optional and is set to one day by default.
+			The result pages are downloaded in parallel over a pool of keep-alive connections. These parameters are
+			optional:
+			'bing_api_url': The URL of the Bing Web search API. It can point to a local server for testing.
+			'fetch_timeout': The connect and read timeouts of each HTTP request (in seconds). The default value is 3.
+			'fetch_max_bytes': The maximum number of bytes read from a Web page. The default value is 1MB.
+			'fetch_deadline': The maximum time for downloading all the result pages (in seconds). The pages that are
+			not downloaded in time (or fail) are replaced by their snippets. The default value is 5.
+			'fetch_snippet_fallback': If False, these pages are dropped instead. The default value is True.
+			'max_fetch_threads': The maximum number of concurrent downloads. The default value is 10.
+			The API calls of all the processes forked after this object is created (e.g., the action workers) are
+			rate limited together, and identical concurrent API calls are run once. These parameters are optional:
+			'bing_max_qps': The maximum number of API calls per second. The default value is 3. If it is None, the calls
+			are not rate limited.
+			'bing_burst': The maximum number of API calls in a burst. The default value is 'bing_max_qps'.
+			'bing_max_wait': The maximum time that an API call waits for the rate limiter (in seconds). The call fails
+			after that. The default value is 5.
+			'bing_coalesce': Whether identical concurrent API calls are coalesced. The default value is True.
+			'http_cache': A core.retrieval.http_cache.HttpCache for the API responses and the downloaded pages. This
+			parameter is optional.
+			'bing_lazy_pages': If True, the results are core.retrieval.doc.LazyDocuments that download the pages only
+			when their text is read (e.g., by the question answering action), so retrieval takes a single API call.
+			The default value is False.
+			The HTTP traffic (API responses and pages) can be recorded and replayed, e.g., for offline benchmarks. These
+			parameters are optional:
+			'web_archive_mode': None (the default), 'record' (the responses are stored in the archive), or 'replay'
+			(the responses are served by a local replay server, and nothing is sent to the Web). In the 'replay' mode,
+			the API calls are neither rate limited nor coalesced.
+			'web_archive_path': The path to the archive file (see core.retrieval.web_archive.WebArchive).
+			'replay_latency' and 'replay_latency_jitter': The injected latency of each replayed response, and the
+			maximum random latency added to it (in seconds). The default values are 0.
 		"""
 		super().__init__(params)
 		self.results_requested = self.params['results_requested'] if 'results_requested' in self.params else 1
 		self.subscription_key = self.params['bing_key']
-		self.bing_api_url = 'https://api.cognitive.microsoft.com/bing/v7.0/search'
+		self.bing_api_url = self.params['bing_api_url'] if 'bing_api_url' in self.params \
+			else 'https://api.cognitive.microsoft.com/bing/v7.0/search'
 		self.header = {"Ocp-Apim-Subscription-Key": self.subscription_key}
-		params['logger'].warning('There is a maximum number of transactions per second for the Bing API.')
+		self.web_doc_ttl = self.params['web_doc_ttl'] if 'web_doc_ttl' in self.params else 24 * 60 * 60
+		self.fetch_timeout = self.params['fetch_timeout'] if 'fetch_timeout' in self.params else 3
+		self.fetch_max_bytes = self.params['fetch_max_bytes'] if 'fetch_max_bytes' in self.params else 1024 * 1024
+		self.fetch_deadline = self.params['fetch_deadline'] if 'fetch_deadline' in self.params else 5
+		self.fetch_snippet_fallback = self.params['fetch_snippet_fallback'] \
+			if 'fetch_snippet_fallback' in self.params else True
+		self.max_fetch_threads = self.params['max_fetch_threads'] if 'max_fetch_threads' in self.params else 10
+		self.lazy_pages = self.params['bing_lazy_pages'] if 'bing_lazy_pages' in self.params else False
+		self.http_cache = self.params['http_cache'] if 'http_cache' in self.params else None
+		self.fetch_executor = None  # created on the first use, in the process that uses it
+		self.fetch_executor_pid = None
+		self.fetch_executor_lock = threading.Lock()
+		self.web_archive_mode = self.params['web_archive_mode'] if 'web_archive_mode' in self.params else None
+		# The replayed API calls are not limited by Bing, so an offline benchmark measures the throughput of Macaw.
+		replaying = self.web_archive_mode == 'replay'
+		max_qps = self.params['bing_max_qps'] if 'bing_max_qps' in self.params else 3
+		max_wait = self.params['bing_max_wait'] if 'bing_max_wait' in self.params else 5
+		self.rate_limiter = TokenBucket(max_qps, self.params['bing_burst'] if 'bing_burst' in self.params else None,
+										max_wait) if max_qps is not None and not replaying else None
+		self.coalescer = RequestCoalescer(max_wait + 2 * self.fetch_timeout) \
+			if ('bing_coalesce' not in self.params or self.params['bing_coalesce']) and not replaying else None
+		if max_qps is None:
+			params['logger'].warning('There is a maximum number of transactions per second for the Bing API.')
+
+		self.replay_server = None
+		if self.web_archive_mode == 'record':
+			archive = WebArchive(self.params['web_archive_path'])
+			set_http_transport(lambda pool_size: RecordingAdapter(archive, pool_connections=pool_size,
+																  pool_maxsize=pool_size))
+		elif self.web_archive_mode == 'replay':
+			self.replay_server, server_url = start_replay_server(
+				self.params['web_archive_path'],
+				self.params['replay_latency'] if 'replay_latency' in self.params else 0.,
+				self.params['replay_latency_jitter'] if 'replay_latency_jitter' in self.params else 0.)
+			set_http_transport(lambda pool_size: ReplayAdapter(server_url, pool_connections=pool_size,
+															   pool_maxsize=pool_size))
+			params['logger'].info('Replaying the Web archive with the server ' + server_url)
+		elif self.web_archive_mode is not None:
+			raise Exception('The requested Web archive mode does not exist!')
 
 	def retrieve(self, query):
 		"""
@@ -42,20 +227,155 @@ class BingWebSearch(Retrieval):
 			A list of Documents with the maximum length of the 'results_requested' parameter.
 		"""
 		params = {"q": query, "textDecorations": True, "textFormat": "HTML"}
-		response = requests.get(self.bing_api_url, headers=self.header, params=params)
-		response.raise_for_status()
-		search_results = response.json()
+		if self.coalescer is not None:
+			search_results = self.coalescer.call('bing:' + json.dumps(params, sort_keys=True),
+												 lambda: self.call_api(params))
+		else:
+			search_results = self.call_api(params)
+		web_pages = search_results['webPages']['value'][:self.results_requested] \
+			if 'webPages' in search_results else []
+		if self.lazy_pages:
+			# The pages that are not in the document cache are downloaded only if their text is read, and the lazy
+			# documents are not cached.
+			docs = [self.doc_cache.get('bing:' + web_page['url']) if self.doc_cache is not None else None
+					for web_page in web_pages]
+			docs = [doc if doc is not None else self.get_lazy_doc(web_page) for doc, web_page in zip(docs, web_pages)]
+		else:
+			docs = self.get_cached_docs(['bing:' + web_page['url'] for web_page in web_pages],
+										lambda missing: self.fetch_pages([web_pages[i] for i in missing]),
+										self.web_doc_ttl)
 		results = []
-		for i in range(min(len(search_results['webPages']['value']), self.results_requested)):
-			id = search_results['webPages']['value'][i]['url']
-			title = search_results['webPages']['value'][i]['name']
-			snippet = search_results['webPages']['value'][i]['snippet']
-			headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 6.0; WOW64; rv:24.0) Gecko/20100101 Firefox/24.0'}
-			text = html_to_clean_text(requests.get(id, headers=headers).content)
-			score = 10 - i  # this is not a score returned by Bing (just 10 - document rank)
-			results.append(Document(id, title, text, score))
+		for i in range(len(docs)):
+			doc = docs[i]
+			if doc is None and self.fetch_snippet_fallback:
+				doc = self.get_snippet_doc(web_pages[i])
+			if doc is not None:
+				doc.score = 10 - i  # this is not a score returned by Bing (just 10 - document rank)
+				results.append(doc)
 		return results
 
+	def call_api(self, params):
+		"""
+		This method returns the Bing API response from the HTTP cache, or requests it (see 'request_api').
+
+		Args:
+			params(dict): The query string parameters.
+
+		Returns:
+			The decoded JSON response.
+		"""
+		if self.http_cache is None:
+			return self.request_api(params)
+		key = self.bing_api_url + '?' + json.dumps(params, sort_keys=True)
+		return self.http_cache.get_api_response(key, lambda: self.request_api(params))
+
+	def request_api(self, params):
+		"""
+		This method requests the Bing API, after waiting for the rate limiter. If the API responds with '429 Too Many
+		Requests', the rate limiter is paused for the requested time and the request is retried.
+
+		Args:
+			params(dict): The query string parameters.
+
+		Returns:
+			The decoded JSON response.
+		"""
+		session, executor = self.get_http_client()
+		for attempt in range(3):
+			if self.rate_limiter is not None:
+				with tracing.span('bing.rate_limit'):
+					if not self.rate_limiter.acquire():
+						raise Exception('The Bing API rate limit is exceeded!')
+			with tracing.span('bing.api'):
+				response = session.get(self.bing_api_url, headers=self.header, params=params,
+									   timeout=self.fetch_timeout)
+			if response.status_code == 429 and self.rate_limiter is not None and attempt < 2:
+				retry_after = response.headers.get('Retry-After', '1')
+				self.rate_limiter.penalize(float(retry_after) if retry_after.isdigit() else 1.)
+				continue
+			response.raise_for_status()
+			return response.json()
+
+	def get_api_stats(self):
+		"""
+		Returns the rate limiter and the coalescing statistics of the API calls of all processes: the number of 'calls'
+		to the API, 'throttled' calls, 'rejected' calls, 'penalties' (i.e., '429 Too Many Requests' responses), and
+		'coalesced' calls.
+		"""
+		stats = {'calls': 0, 'throttled': 0, 'rejected': 0, 'penalties': 0, 'coalesced': 0}
+		if self.rate_limiter is not None:
+			stats.update(self.rate_limiter.get_stats())
+		if self.coalescer is not None:
+			stats.update(self.coalescer.get_stats())
+		return stats
+
+	def get_http_client(self):
+		# Threads do not survive a fork, so each action worker process creates its own executor.
+		with self.fetch_executor_lock:
+			if self.fetch_executor is None or self.fetch_executor_pid != os.getpid():
+				self.fetch_executor = ThreadPoolExecutor(max_workers=self.max_fetch_threads)
+				self.fetch_executor_pid = os.getpid()
+		return get_http_session(self.max_fetch_threads), self.fetch_executor
+
+	def fetch_pages(self, web_pages):
+		"""
+		This method downloads Web pages in parallel, until the 'fetch_deadline'.
+
+		Args:
+			web_pages(list): A list of Web page objects from the Bing API response.
+
+		Returns:
+			A list of Documents, in the same order as web_pages. The pages that fail or are not downloaded in time are
+			None (so they are not cached).
+		"""
+		session, executor = self.get_http_client()
+		# Each download runs in a copy of the caller's context, so that its span gets the request ID.
+		futures = [executor.submit(contextvars.copy_context().run, self.fetch_page, web_page) for web_page in web_pages]
+		done, not_done = wait(futures, timeout=self.fetch_deadline)
+		docs = []
+		for web_page, future in zip(web_pages, futures):
+			if future in done and future.exception() is None:
+				docs.append(future.result())
+			else:
+				reason = 'the deadline' if future in not_done else str(future.exception())
+				self.params['logger'].warning('Failed to fetch %s: %s', web_page['url'], reason)
+				docs.append(None)
+		return docs
+
+	def fetch_page(self, web_page):
+		"""
+		This method downloads a Web page returned by the Bing API and extracts its clean text.
+
+		Args:
+			web_page(dict): A Web page object from the Bing API response.
+
+		Returns:
+			A Document.
+		"""
+		self.get_http_client()  # the session should be created with the configured pool size
+		text = download_page_text(web_page['url'], self.fetch_timeout, self.fetch_max_bytes, self.fetch_deadline,
+								  self.http_cache)
+		return Document(web_page['url'], web_page['name'], text, 0)
+
+	@staticmethod
+	def get_snippet(web_page):
+		return html.unescape(re.sub('<[^>]+>', '', web_page['snippet']))
+
+	def get_snippet_doc(self, web_page):
+		"""
+		This method returns a Document containing the snippet of a Web page, for the pages that cannot be downloaded.
+		"""
+		return Document(web_page['url'], web_page['name'], self.get_snippet(web_page), 0)
+
+	def get_lazy_doc(self, web_page):
+		"""
+		This method returns a LazyDocument that downloads the Web page when its text is first read. Until then, the
+		snippet is available as 'snippet'.
+		"""
+		loader = functools.partial(download_page_text, web_page['url'], self.fetch_timeout, self.fetch_max_bytes,
+								   self.fetch_deadline, self.http_cache)
+		return LazyDocument(web_page['url'], web_page['name'], self.get_snippet(web_page), 0, loader)
+
 	def get_doc_from_index(self, doc_id):
 		"""
 		This method retrieves a document content for a given document id (i.e., URL).
@@ -0,0 +1,309 @@
+"""
+Bounded caches for retrieval, e.g., for the cleaned documents fetched from the search engines.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class Cache(ABC):
+    def __init__(self, max_bytes, ttl=None):
+        """
+        An abstract class for bounded key-value caches. Values are stored pickled, so a cached value cannot be changed
+        by modifying the object returned by 'get' (e.g., setting the score of a cached Document). The least recently
+        used entries are evicted when the total size of the pickled values exceeds max_bytes.
+
+        Args:
+            max_bytes(int): The maximum total size of the cached values in bytes.
+            ttl(float): The default time to live of the entries in seconds. None means that entries do not expire.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def get_expiration_time(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl is not None else None
+
+    @abstractmethod
+    def get(self, key):
+        """
+        Looks up a key.
+
+        Args:
+            key(str): The key.
+
+        Returns:
+            The cached value, or None if the key is not in the cache or it has expired.
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key, value, ttl=None):
+        """
+        Adds a value to the cache.
+
+        Args:
+            key(str): The key.
+            value(object): A picklable value.
+            ttl(float): The time to live of this entry in seconds. If not given, the default TTL is used.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        """
+        Removes a key from the cache, if it exists.
+
+        Args:
+            key(str): The key.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """
+        Removes all the entries. The hit and miss counters are kept.
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(self):
+        """
+        Returns a dict containing 'hits', 'misses', 'hit_rate', 'entries', and 'bytes'.
+        """
+        pass
+
+    @staticmethod
+    def make_stats(hits, misses, entries, size):
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.,
+                'entries': entries, 'bytes': size}
+
+
+class MemoryCache(Cache):
+    def __init__(self, max_bytes, ttl=None):
+        """
+        A thread-safe in-memory LRU cache. Note that each process has its own copy, so the entries added by an action
+        worker process are not visible to the other workers.
+
+        Args:
+            max_bytes(int): The maximum total size of the cached values in bytes.
+            ttl(float): The default time to live of the entries in seconds. None means that entries do not expire.
+        """
+        super().__init__(max_bytes, ttl)
+        self.entries = OrderedDict()  # key -> (pickled value, expiration time)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                data, expiration_time = self.entries[key]
+                if expiration_time is None or expiration_time > time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return pickle.loads(data)
+                self.remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl=None):
+        data = pickle.dumps(value)
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (data, self.get_expiration_time(ttl))
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def remove(self, key):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[0])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self):
+        with self.lock:
+            return self.make_stats(self.hits, self.misses, len(self.entries), self.size)
+
+
+class SqliteCache(Cache):
+    def __init__(self, path, max_bytes, ttl=None, read_only=False):
+        """
+        An LRU cache stored in a SQLite database file, so that it is shared by all processes, including the action
+        worker processes of the request dispatcher. The hit and miss counters are stored in the same database. Each
+        process opens its own connection. A SqliteCache can be pickled, e.g., to send it to another process.
+
+        Args:
+            path(str): The path to the database file.
+            max_bytes(int): The maximum total size of the cached values in bytes.
+            ttl(float): The default time to live of the entries in seconds. None means that entries do not expire.
+            read_only(bool): If True, an existing database is opened read-only: 'get' does not change it (so neither
+            the LRU order nor the counters are updated) and ignores the expiration times, and 'put', 'delete', and
+            'clear' do nothing. This is useful for replaying experiments with a fixed cache.
+        """
+        super().__init__(max_bytes, ttl)
+        self.path = path
+        self.read_only = read_only
+        self.conn = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if read_only:
+            return
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                             'expiration_time REAL, access_time REAL)')
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_access_time ON entries (access_time)')
+                conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+                conn.executemany('INSERT OR IGNORE INTO stats VALUES (?, 0)', [('hits',), ('misses',), ('bytes',)])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['conn'], state['pid'], state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.conn = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        # SQLite connections should not be used across a fork, so each process opens its own connection.
+        if self.conn is None or self.pid != os.getpid():
+            if self.read_only:
+                self.conn = sqlite3.connect('file:%s?mode=ro' % self.path, uri=True, timeout=30,
+                                            check_same_thread=False, isolation_level=None)
+            else:
+                self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+                self.conn.execute('PRAGMA journal_mode=WAL')
+            self.pid = os.getpid()
+        return self.conn
+
+    def get(self, key):
+        now = time.time()
+        if self.read_only:
+            # A fixed cache is replayed as it was recorded, so the entries do not expire.
+            with self.lock:
+                row = self.get_connection().execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            return pickle.loads(row[0]) if row is not None else None
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT value, size, expiration_time FROM entries WHERE key = ?', (key,)).fetchone()
+                if row is not None and (row[2] is None or row[2] > now):
+                    conn.execute('UPDATE entries SET access_time = ? WHERE key = ?', (now, key))
+                    conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+                    return pickle.loads(row[0])
+                if row is not None:
+                    conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                    conn.execute("UPDATE stats SET value = value - ? WHERE name = 'bytes'", (row[1],))
+                conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+
+    def put(self, key, value, ttl=None):
+        data = pickle.dumps(value)
+        if len(data) > self.max_bytes or self.read_only:
+            return
+        now = time.time()
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self.remove(conn, key)
+                conn.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                             (key, data, len(data), self.get_expiration_time(ttl), now))
+                conn.execute("UPDATE stats SET value = value + ? WHERE name = 'bytes'", (len(data),))
+                size = conn.execute("SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+                while size > self.max_bytes:
+                    old_entries = conn.execute('SELECT key, size FROM entries ORDER BY access_time '
+                                               'LIMIT 100').fetchall()
+                    if len(old_entries) == 0:
+                        break
+                    for (old_key, old_size) in old_entries:
+                        self.remove(conn, old_key)
+                        size -= old_size
+                        if size <= self.max_bytes:
+                            break
+
+    def delete(self, key):
+        if self.read_only:
+            return
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                self.remove(conn, key)
+
+    @staticmethod
+    def remove(conn, key):
+        row = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            conn.execute("UPDATE stats SET value = value - ? WHERE name = 'bytes'", (row[0],))
+
+    def clear(self):
+        if self.read_only:
+            return
+        with self.lock:
+            conn = self.get_connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM entries')
+                conn.execute("UPDATE stats SET value = 0 WHERE name = 'bytes'")
+
+    def get_stats(self):
+        with self.lock:
+            conn = self.get_connection()
+            stats = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return self.make_stats(stats['hits'], stats['misses'], entries, stats['bytes'])
+
+
+def get_cache(params, prefix):
+    """
+    This method returns the Cache requested in the parameter dict.
+
+    Args:
+        params(dict): A dict of parameters. The parameter prefix + '_cache' determines the cache backend and can be
+        either 'memory' or 'sqlite'. If it is not given, None is returned. The parameters prefix + '_cache_max_bytes'
+        (default: 100MB) and prefix + '_cache_ttl' (in seconds, default: None, i.e., no expiration) are optional. The
+        'sqlite' cache requires the parameter prefix + '_cache_path', and it is read-only if the optional parameter
+        prefix + '_cache_read_only' is True.
+        prefix(str): The parameter prefix, e.g., 'doc'.
+
+    Returns:
+        A Cache object or None.
+    """
+    backend = params[prefix + '_cache'] if prefix + '_cache' in params else None
+    max_bytes = params[prefix + '_cache_max_bytes'] if prefix + '_cache_max_bytes' in params else 100 * 1024 * 1024
+    ttl = params[prefix + '_cache_ttl'] if prefix + '_cache_ttl' in params else None
+    if backend is None:
+        return None
+    elif backend == 'memory':
+        return MemoryCache(max_bytes, ttl)
+    elif backend == 'sqlite':
+        read_only = params[prefix + '_cache_read_only'] if prefix + '_cache_read_only' in params else False
+        return SqliteCache(params[prefix + '_cache_path'], max_bytes, ttl, read_only)
+    else:
+        raise Exception('The requested cache does not exist!')
@@ -10,7 +10,7 @@ import justext
 
 
 class Document:
-    def __init__(self, id, title, text, score):
+    def __init__(self, id, title, text, score, parent_id=None):
         """
             A simple class representing a document for retrieval.
         Args:
@@ -18,11 +18,50 @@ class Document:
             title(str): Document title (if any).
             text(str): Document content.
             score(float): The retrieval score.
+            parent_id(str): The ID of the document that this passage is taken from, or None if this is a whole document
+            (see core.retrieval.passage).
         """
         self.id = id
         self.title = title
         self.text = text
         self.score = score
+        self.parent_id = parent_id
+
+
+class LazyDocument(Document):
+    def __init__(self, id, title, snippet, score, loader, parent_id=None):
+        """
+            A document whose text is loaded when it is first read, e.g., a Web page that is downloaded only if the text
+            is needed. Lazy documents can be pickled before or after loading, e.g., to send them to another process.
+        Args:
+            id(str): Document ID.
+            title(str): Document title (if any).
+            snippet(str): A short summary of the document that is available without loading it.
+            score(float): The retrieval score.
+            loader(callable): A picklable function without arguments that returns the document text, e.g., a
+            functools.partial of a module-level function. If it fails, the text is the snippet.
+            parent_id(str): The ID of the document that this passage is taken from (see Document).
+        """
+        super().__init__(id, title, None, score, parent_id)
+        self.snippet = snippet
+        self.loader = loader
+
+    @property
+    def text(self):
+        if self._text is None:
+            try:
+                self._text = self.loader()
+            except Exception:
+                self._text = self.snippet
+            self.loader = None
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+
+    def is_loaded(self):
+        return self._text is not None
 
 
 def get_recursive_content_as_str(doc):
@@ -0,0 +1,179 @@
+"""
+A read-only, memory-mapped store of pre-cleaned documents and its offline builders.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+import mmap
+import os
+import struct
+
+from macaw.core.retrieval.doc import Document, get_trec_doc
+
+MAGIC = b'MACAWDS1'
+DEFAULT_DOC_STORE_NAME = 'macaw_docs.bin'  # the store that Indri looks for in its index directory, if none is given
+HEADER_FORMAT = '<8sQQ'  # magic, number of slots, the smallest document ID
+FIELD_LENGTHS_FORMAT = '<III'  # lengths of the external ID, title, and text in bytes
+
+
+class DocumentStore:
+    def __init__(self, path):
+        """
+        A document store built offline by 'build_document_store'. The documents are already cleaned, so reading a
+        document does not require any TREC parsing or boilerplate removal. The file is memory-mapped read-only, so its
+        pages are shared by all the processes that read it, including the forked action workers.
+
+        The file format is a header, an offset table with one slot per internal document ID (from the smallest to the
+        largest stored ID), and the document records. Each record contains the lengths of the external ID, title, and
+        text, followed by these fields encoded in UTF-8.
+
+        Args:
+            path(str): The path to the document store file.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_slots, self.base_doc_id = struct.unpack_from(HEADER_FORMAT, self.mm, 0)
+        if magic != MAGIC:
+            raise Exception('The file is not a document store: ' + path)
+        table_start = struct.calcsize(HEADER_FORMAT)
+        self.data_start = table_start + (self.num_slots + 1) * 8
+        self.offsets = memoryview(self.mm)[table_start:self.data_start].cast('Q')
+
+    def __len__(self):
+        return self.num_slots
+
+    def get_doc(self, doc_id):
+        """
+        Reads a document.
+
+        Args:
+            doc_id(str or int): The internal document ID.
+
+        Returns:
+            A Document with the stored external ID, title, and text (like core.retrieval.doc.get_trec_doc), or None if
+            the document is not in the store.
+        """
+        slot = int(doc_id) - self.base_doc_id
+        if slot < 0 or slot >= self.num_slots or self.offsets[slot] == self.offsets[slot + 1]:
+            return None
+        start = self.data_start + self.offsets[slot]
+        ext_id_length, title_length, text_length = struct.unpack_from(FIELD_LENGTHS_FORMAT, self.mm, start)
+        start += struct.calcsize(FIELD_LENGTHS_FORMAT)
+        ext_id = self.mm[start:start + ext_id_length].decode('UTF-8')
+        start += ext_id_length
+        title = self.mm[start:start + title_length].decode('UTF-8')
+        start += title_length
+        text = self.mm[start:start + text_length].decode('UTF-8')
+        return Document(ext_id, title, text, 0.)
+
+    def get_docs(self, doc_ids):
+        """
+        Reads a list of documents.
+
+        Args:
+            doc_ids(list): A list of internal document IDs.
+
+        Returns:
+            A list of Documents (or None for the missing ones), in the same order as doc_ids.
+        """
+        return [self.get_doc(doc_id) for doc_id in doc_ids]
+
+
+def build_document_store(docs, output_path):
+    """
+    Builds a document store file.
+
+    Args:
+        docs(iterable): An iterable of (internal document ID, Document) pairs in increasing order of the internal IDs,
+        where Document.id is the external ID.
+        output_path(str): The path to the output file.
+
+    Returns:
+        The number of stored documents.
+    """
+    data_path = output_path + '.data'
+    offsets = dict()  # internal document ID -> start of its record in the data section
+    position = 0
+    last_doc_id = None
+    with open(data_path, 'wb') as data_file:
+        for doc_id, doc in docs:
+            if last_doc_id is not None and int(doc_id) <= last_doc_id:
+                raise Exception('The documents should be given in increasing order of their internal IDs!')
+            last_doc_id = int(doc_id)
+            fields = [str(doc.id).encode('UTF-8'), str(doc.title).encode('UTF-8'), str(doc.text).encode('UTF-8')]
+            record = struct.pack(FIELD_LENGTHS_FORMAT, *[len(field) for field in fields]) + b''.join(fields)
+            data_file.write(record)
+            offsets[int(doc_id)] = position
+            position += len(record)
+
+    base_doc_id = min(offsets) if len(offsets) > 0 else 0
+    num_slots = max(offsets) - base_doc_id + 1 if len(offsets) > 0 else 0
+    # Each slot holds the start of its record. Missing documents get empty records, i.e., the start of the next one.
+    table = [position] * (num_slots + 1)
+    for slot in range(num_slots - 1, -1, -1):
+        doc_id = slot + base_doc_id
+        table[slot] = offsets[doc_id] if doc_id in offsets else table[slot + 1]
+
+    with open(output_path, 'wb') as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, num_slots, base_doc_id))
+        f.write(struct.pack('<%dQ' % len(table), *table))
+        with open(data_path, 'rb') as data_file:
+            while True:
+                chunk = data_file.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+    os.remove(data_path)
+    return len(offsets)
+
+
+def iterate_trectext_files(file_paths, first_doc_id=1):
+    """
+    Reads and cleans the documents of trectext files. Internal IDs are assigned sequentially, which matches the Indri
+    internal IDs if the files are given in the same order as they were indexed.
+
+    Args:
+        file_paths(list): A list of paths to trectext files.
+        first_doc_id(int): The internal ID of the first document.
+
+    Returns:
+        A generator of (internal document ID, Document) pairs.
+    """
+    doc_id = first_doc_id
+    for file_path in file_paths:
+        with open(file_path, encoding='UTF-8', errors='ignore') as f:
+            lines = []
+            for line in f:
+                lines.append(line)
+                if line.strip().lower().endswith('</doc>'):
+                    yield doc_id, get_trec_doc(''.join(lines))
+                    doc_id += 1
+                    lines = []
+
+
+def iterate_indri_index(indri, batch_size=100):
+    """
+    Reads and cleans all the documents of an Indri index.
+
+    Args:
+        indri(core.retrieval.indri.Indri): The Indri retrieval model.
+        batch_size(int): The number of documents fetched at once.
+
+    Returns:
+        A generator of (internal document ID, Document) pairs.
+    """
+    doc_ids = list(range(indri.index.document_base(), indri.index.maximum_document()))
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start:start + batch_size]
+        for doc_id, doc in zip(batch, indri.fetch_docs(batch, use_doc_store=False)):
+            yield doc_id, doc
+
+
+if __name__ == '__main__':
+    # Builds a document store from trectext files. The files should be given in the order that they were indexed. If
+    # the store is written to DEFAULT_DOC_STORE_NAME in the Indri index directory, Indri uses it by default.
+    params = {'trectext_files': ['PATH_TO_TRECTEXT_FILE'],
+              'doc_store_path': os.path.join('PATH_TO_INDRI_INDEX', DEFAULT_DOC_STORE_NAME)}
+    print(build_document_store(iterate_trectext_files(params['trectext_files']), params['doc_store_path']),
+          'documents are stored.')
@@ -0,0 +1,119 @@
+"""
+A persistent HTTP cache for Web APIs and Web pages, with conditional revalidation.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+import time
+
+from macaw.core.retrieval.cache import SqliteCache
+
+
+class HttpCache:
+    def __init__(self, path, max_bytes, api_ttl=10 * 60, page_ttl=60 * 60, read_only=False):
+        """
+        An HTTP cache stored in a SQLite database file (see core.retrieval.cache.SqliteCache), so that it is shared by
+        all processes and survives restarts. The least recently used responses are evicted when the cache is full.
+        There are two policies:
+        - API responses ('get_api_response') are cached for a short time and are requested again when they expire.
+        - Web pages ('get_page') are fresh for a while. After that, they are revalidated with a conditional request
+        (If-None-Match or If-Modified-Since), so a page that has not changed is not downloaded again. The pages
+        without ETag and Last-Modified are downloaded again, and the pages with 'Cache-Control: no-store' are not
+        cached.
+        In the read-only mode, the cached responses never expire and nothing is requested or cached, so that an
+        experiment can be replayed offline with exactly the same responses. A request that is not in the cache fails.
+        An HttpCache can be pickled, e.g., to send it to another process.
+
+        Args:
+            path(str): The path to the database file.
+            max_bytes(int): The maximum total size of the cached responses in bytes.
+            api_ttl(float): The time to live of the API responses (in seconds).
+            page_ttl(float): The time that a page is used without revalidation (in seconds).
+            read_only(bool): Whether the cache is read-only.
+        """
+        self.cache = SqliteCache(path, max_bytes, read_only=read_only)
+        self.api_ttl = api_ttl
+        self.page_ttl = page_ttl
+        self.read_only = read_only
+
+    def get_api_response(self, key, fetch_func):
+        """
+        Returns a cached API response, or requests it if it is not cached or it has expired.
+
+        Args:
+            key(str): The cache key, e.g., the URL and the query parameters (without any credentials).
+            fetch_func(callable): A function without arguments that requests the API and returns the response.
+
+        Returns:
+            The API response.
+        """
+        response = self.cache.get('api:' + key)
+        if response is not None:
+            return response
+        if self.read_only:
+            raise Exception('The API request is not in the read-only HTTP cache: ' + key)
+        response = fetch_func()
+        self.cache.put('api:' + key, response, self.api_ttl)
+        return response
+
+    def get_page(self, url, fetch_func):
+        """
+        Returns the body of a cached Web page, revalidating it if it is not fresh, or downloads it.
+
+        Args:
+            url(str): The page URL.
+            fetch_func(callable): A function that gets a dict of additional request headers (the validators) and
+            downloads the page. It returns a tuple of the HTTP status code, the response headers, and the body. The
+            status code is 304 if the cached page has not changed.
+
+        Returns:
+            The body of the page.
+        """
+        entry = self.cache.get('page:' + url)
+        if entry is not None and (self.read_only or entry['fresh_until'] > time.time()):
+            return entry['body']
+        if self.read_only:
+            raise Exception('The page is not in the read-only HTTP cache: ' + url)
+
+        validators = dict()
+        if entry is not None and entry['etag'] is not None:
+            validators['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified'] is not None:
+            validators['If-Modified-Since'] = entry['last_modified']
+        status, headers, body = fetch_func(validators)
+        if status == 304 and entry is not None:
+            entry['fresh_until'] = time.time() + self.page_ttl
+            self.cache.put('page:' + url, entry)
+            return entry['body']
+        if 'no-store' not in headers.get('Cache-Control', ''):
+            self.cache.put('page:' + url, {'body': body, 'etag': headers.get('ETag'),
+                                           'last_modified': headers.get('Last-Modified'),
+                                           'fresh_until': time.time() + self.page_ttl})
+        return body
+
+    def get_stats(self):
+        """
+        Returns the statistics of the underlying cache (see core.retrieval.cache.Cache.get_stats).
+        """
+        return self.cache.get_stats()
+
+
+def get_http_cache(params):
+    """
+    This method returns the HttpCache requested in the parameter dict.
+
+    Args:
+        params(dict): A dict of parameters. If 'http_cache_path' is not given (or is None), None is returned. The
+        parameters 'http_cache_max_bytes' (default: 1GB), 'http_cache_api_ttl' (in seconds, default: 10 minutes),
+        'http_cache_page_ttl' (in seconds, default: 1 hour), and 'http_cache_read_only' (default: False) are optional.
+
+    Returns:
+        An HttpCache object or None.
+    """
+    if 'http_cache_path' not in params or params['http_cache_path'] is None:
+        return None
+    return HttpCache(params['http_cache_path'],
+                     params['http_cache_max_bytes'] if 'http_cache_max_bytes' in params else 1024 * 1024 * 1024,
+                     params['http_cache_api_ttl'] if 'http_cache_api_ttl' in params else 10 * 60,
+                     params['http_cache_page_ttl'] if 'http_cache_page_ttl' in params else 60 * 60,
+                     params['http_cache_read_only'] if 'http_cache_read_only' in params else False)
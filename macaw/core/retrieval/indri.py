@@ -4,16 +4,25 @@ The Indri search engine.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import os
 import subprocess
+import threading
 
 import pyndri
 
 from macaw.core.retrieval.doc import get_trec_doc
+from macaw.core.retrieval.doc_store import DEFAULT_DOC_STORE_NAME, DocumentStore
 from macaw.core.retrieval.search_engine import Retrieval
+from macaw.core.retrieval.vocabulary import IndriVocabulary
+from macaw.util import tracing
 
 
 class Indri(Retrieval):
+	query_cache_params = ['index', 'results_requested']
+	store_retrieved_docs = True
+
 	def __init__(self, params):
 		"""
 		The Indri retrieval model. Indri is an open-source search engine implemented as part of the lemur project by
@@ -29,14 +38,43 @@ class Indri(Retrieval):
 			'index': The path to the Indri index constructed from the collection.
 			'results_requested': The maximum number of requested documents for retrieval. If not given, it is set to 1.
 			'text_format': The text format for document collection (e.g., 'trectext').
+			'max_dumpindex_processes': The maximum number of concurrent dumpindex processes used for fetching documents.
+			This parameter is optional and is set to 'results_requested' by default.
+			'doc_store_path': The path to a document store built by core.retrieval.doc_store from the same collection.
+			This parameter is optional and is set to the file 'macaw_docs.bin' (doc_store.DEFAULT_DOC_STORE_NAME) in the
+			index directory, if it exists. The documents are read from the store and dumpindex is only used for the
+			documents that are missing from it. Without a store, every fetched document costs a dumpindex process, so
+			the store is the recommended setup and a warning is logged if there is none.
+			'vocabulary_cache_dir': The directory that the vocabulary statistics are cached in (see
+			core.retrieval.vocabulary.IndriVocabulary). This parameter is optional.
+			'max_query_threads': The maximum number of threads that run the queries of 'retrieve_many'. This parameter
+			is optional and is set to the number of CPUs by default.
 			Note that the parameters 'query_generation' and 'logger' are required by the parent class.
 		"""
 		super().__init__(params)
 		self.results_requested = self.params['results_requested'] if 'results_requested' in self.params else 1
 		self.indri_path = self.params['indri_path']
+		self.dumpindex_path = os.path.join(self.indri_path, 'dumpindex/dumpindex')
+		self.max_dumpindex_processes = self.params['max_dumpindex_processes'] \
+			if 'max_dumpindex_processes' in self.params else max(self.results_requested, 1)
 		self.index = pyndri.Index(self.params['index'])
-		self.term2id, self.id2term, self.id2df = self.index.get_dictionary()
-		self.id2tf = self.index.get_term_frequencies()
+		doc_store_path = self.params['doc_store_path'] if 'doc_store_path' in self.params else None
+		if doc_store_path is None and os.path.exists(os.path.join(self.params['index'], DEFAULT_DOC_STORE_NAME)):
+			doc_store_path = os.path.join(self.params['index'], DEFAULT_DOC_STORE_NAME)
+		self.doc_store = DocumentStore(doc_store_path) if doc_store_path is not None else None
+		if self.doc_store is None:
+			self.params['logger'].warning('No document store is given for the Indri index %s, so the documents are '
+										  'fetched by running one dumpindex process per document. Build one using '
+										  'core.retrieval.doc_store.', self.params['index'])
+		# The vocabulary statistics are not needed for retrieval, so they are loaded on the first use.
+		self.vocabulary = IndriVocabulary(self.index, self.params['index'], self.params['vocabulary_cache_dir']
+										  if 'vocabulary_cache_dir' in self.params else None)
+		self.max_query_threads = self.params['max_query_threads'] if 'max_query_threads' in self.params \
+			else os.cpu_count()
+		self.query_executor = None  # created on the first use, in the process that uses it
+		self.query_executor_pid = None
+		self.query_executor_lock = threading.Lock()
+		self.thread_local = threading.local()
 
 	def retrieve(self, query):
 		"""
@@ -48,16 +86,150 @@ class Indri(Retrieval):
 		Returns:
 			A list of Documents with the maximum length of the 'results_requested' parameter.
 		"""
-		int_results = self.index.query(query, results_requested=self.results_requested)
-		results = []
-		for int_doc_id, score in int_results:
-			# ext_doc_id, content_term_id = self.index.document(int_doc_id)
-			# index_content = [self.id2term[term_id] if term_id> 0 else 'UNK' for term_id in content_term_id]
-			doc = self.get_doc_from_index(int_doc_id)[0]
-			doc.score = score
-			doc.id = str(int_doc_id)
-			results.append(doc)
-		return results
+		with tracing.span('indri.query'):
+			int_results = self.index.query(query, results_requested=self.results_requested)
+		return self.get_result_lists([int_results])[0]
+
+	def retrieve_ids(self, query):
+		"""
+		This method returns the internal IDs and scores of the retrieved documents, without fetching the documents.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of (document ID, score) pairs with the maximum length of the 'results_requested' parameter.
+		"""
+		with tracing.span('indri.query'):
+			int_results = self.index.query(query, results_requested=self.results_requested)
+		return [(str(int_doc_id), score) for int_doc_id, score in int_results]
+
+	def retrieve_many(self, queries):
+		"""
+		This method retrieves documents for a batch of queries. The queries run concurrently in a thread pool, each
+		thread with its own pyndri.Index, since an Indri query environment should not be shared between threads. Then,
+		the union of the retrieved documents is fetched once.
+
+		Args:
+			queries(list): A list of query strings.
+
+		Returns:
+			A list of lists of Documents, in the same order as the queries.
+		"""
+		if len(queries) <= 1:
+			return [self.retrieve(query) for query in queries]
+		with tracing.span('indri.query_many'):
+			int_results_list = list(self.get_query_executor().map(self.run_query, queries))
+		return self.get_result_lists(int_results_list)
+
+	def get_query_executor(self):
+		# Threads do not survive a fork, so each action worker process creates its own executor.
+		with self.query_executor_lock:
+			if self.query_executor is None or self.query_executor_pid != os.getpid():
+				self.query_executor = ThreadPoolExecutor(max_workers=self.max_query_threads)
+				self.query_executor_pid = os.getpid()
+			return self.query_executor
+
+	def run_query(self, query):
+		if not hasattr(self.thread_local, 'index'):
+			self.thread_local.index = pyndri.Index(self.params['index'])
+		return self.thread_local.index.query(query, results_requested=self.results_requested)
+
+	def get_result_lists(self, int_results_list):
+		"""
+		This method builds the result lists from the internal document IDs and scores returned by Indri. Each document
+		is fetched once, even if it is retrieved for multiple queries.
+
+		Args:
+			int_results_list(list): A list of lists of (internal document ID, score) pairs.
+
+		Returns:
+			A list of lists of Documents.
+		"""
+		doc_ids = []
+		for int_results in int_results_list:
+			for int_doc_id, score in int_results:
+				doc_ids.append(int_doc_id)
+		doc_ids = list(dict.fromkeys(doc_ids))  # the union of the retrieved documents, in order
+		docs = self.get_docs(doc_ids)
+		id2doc = dict(zip(doc_ids, docs))
+
+		result_lists = []
+		for int_results in int_results_list:
+			results = []
+			for int_doc_id, score in int_results:
+				# ext_doc_id, content_term_id = self.index.document(int_doc_id)
+				# index_content = [self.vocabulary.id_to_term(term_id) if term_id > 0 else 'UNK'
+				# 				 for term_id in content_term_id]
+				doc = copy.copy(id2doc[int_doc_id])
+				doc.score = score
+				doc.id = str(int_doc_id)
+				results.append(doc)
+			result_lists.append(results)
+		return result_lists
+
+	def get_docs(self, doc_ids):
+		"""
+		This method retrieves the documents for a list of internal document ids, using the document cache (if any).
+
+		Args:
+			doc_ids(list): A list of document IDs.
+
+		Returns:
+			A list of Documents, in the same order as doc_ids.
+		"""
+		return self.get_cached_docs(['indri:%s:%s' % (self.params['index'], doc_id) for doc_id in doc_ids],
+									lambda missing: self.fetch_docs([doc_ids[i] for i in missing]))
+
+	def fetch_docs(self, doc_ids, use_doc_store=True):
+		"""
+		This method fetches the documents for a list of internal document ids. The pre-cleaned documents are read from
+		the document store, if there is one. Pyndri does not expose the raw document text and dumpindex prints a single
+		document per run, so the other documents are fetched by one dumpindex process each. These processes run
+		concurrently (at most 'max_dumpindex_processes' at a time), but they are only a fallback for the documents
+		missing from the store.
+
+		Args:
+			doc_ids(list): A list of document IDs.
+			use_doc_store(bool): False, to ignore the document store (e.g., when building it).
+
+		Returns:
+			A list of Documents, in the same order as doc_ids.
+		"""
+		if self.doc_store is not None and use_doc_store:
+			with tracing.span('indri.doc_store'):
+				docs = self.doc_store.get_docs(doc_ids)
+			missing = [i for i in range(len(docs)) if docs[i] is None]
+			if len(missing) > 0:
+				for i, doc in zip(missing, self.fetch_docs([doc_ids[i] for i in missing], use_doc_store=False)):
+					docs[i] = doc
+			return docs
+
+		contents = []
+		with tracing.span('indri.dumpindex'):
+			for start in range(0, len(doc_ids), self.max_dumpindex_processes):
+				processes = [subprocess.Popen([self.dumpindex_path, self.params['index'], 'dt', str(doc_id)],
+											  stdout=subprocess.PIPE)
+							 for doc_id in doc_ids[start:start + self.max_dumpindex_processes]]
+				for process in processes:
+					contents.append(process.communicate()[0].decode('UTF-8'))
+		return [self.parse_doc(content) for content in contents]
+
+	def parse_doc(self, content):
+		"""
+		This method parses the document content returned by dumpindex.
+
+		Args:
+			content(str): The document content.
+
+		Returns:
+			A Document.
+		"""
+		if self.params['text_format'] == 'trectext':
+			with tracing.span('indri.get_trec_doc'):
+				return get_trec_doc(content)
+		else:
+			raise Exception('The requested text format is not supported!')
 
 	def get_doc_from_index(self, doc_id):
 		"""
@@ -70,10 +242,4 @@ class Indri(Retrieval):
 			A Document from the collection whose ID is equal to the given doc_id. For some reasons, the method returns
 			a list of Documents with a length of 1.
 		"""
-		content = subprocess.run([os.path.join(self.indri_path, 'dumpindex/dumpindex'), self.params['index'],
-								  'dt', str(doc_id)], stdout=subprocess.PIPE).stdout.decode('UTF-8')
-		if self.params['text_format'] == 'trectext':
-			doc = get_trec_doc(content)
-		else:
-			raise Exception('The requested text format is not supported!')
-		return [doc]
\ No newline at end of file
+		return self.get_docs([doc_id])
\ No newline at end of file
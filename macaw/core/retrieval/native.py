@@ -0,0 +1,615 @@
+"""
+A built-in search engine based on an inverted index implemented with NumPy.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from bisect import bisect_right
+from collections import Counter
+import fcntl
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from macaw.core.retrieval.doc import Document, get_trec_doc
+from macaw.core.retrieval.doc_store import DocumentStore, build_document_store
+from macaw.core.retrieval.search_engine import Retrieval
+from macaw.util import tracing
+
+
+def tokenize(text):
+	"""
+	The tokenizer used for both indexing and querying: lower-cased alphanumeric tokens.
+
+	Args:
+		text(str): The text.
+
+	Returns:
+		A list of str tokens.
+	"""
+	return re.findall(r'\w+', text.lower())
+
+
+def varbyte_encode(values):
+	"""
+	Encodes non-negative integers with variable byte encoding: 7 bits per byte, least significant group first, and the
+	high bit set on all bytes except the last byte of each integer.
+
+	Args:
+		values(numpy.ndarray): An array of non-negative integers.
+
+	Returns:
+		A numpy.ndarray of uint8.
+	"""
+	values = np.asarray(values, dtype=np.uint64)
+	num_bytes = np.ones(len(values), dtype=np.int64)
+	for i in range(1, 10):
+		num_bytes += values >= np.uint64(1) << np.uint64(7 * i)
+	group = np.repeat(np.arange(len(values)), num_bytes)
+	position = np.arange(num_bytes.sum()) - np.repeat(np.cumsum(num_bytes) - num_bytes, num_bytes)
+	data = (values[group] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7f)
+	data[position < num_bytes[group] - 1] |= np.uint64(0x80)
+	return data.astype(np.uint8)
+
+
+def varbyte_decode(data):
+	"""
+	Decodes the integers encoded by 'varbyte_encode'. The integers are expected to be smaller than 2^53.
+
+	Args:
+		data(numpy.ndarray): An array of uint8.
+
+	Returns:
+		A numpy.ndarray of int64.
+	"""
+	data = np.asarray(data, dtype=np.uint8)
+	ends = np.flatnonzero(data < 0x80)
+	starts = np.concatenate([[0], ends[:-1] + 1])
+	group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+	position = np.arange(len(data)) - starts[group]
+	weights = (data & 0x7f).astype(np.float64) * np.power(2., 7 * position)
+	return np.bincount(group, weights=weights, minlength=len(ends)).astype(np.int64)
+
+
+class NativeIndex:
+	def __init__(self, index_dir):
+		"""
+		A read-only inverted index built by 'build_native_index'. The postings list of each term contains the document
+		ID gaps followed by the term frequencies, compressed with variable byte encoding. All the arrays are
+		memory-mapped, so they are shared by the processes that use the index. The documents are stored in a
+		core.retrieval.doc_store.DocumentStore.
+
+		Args:
+			index_dir(str): The index directory.
+		"""
+		self.index_dir = index_dir
+		with open(os.path.join(index_dir, 'meta.json')) as f:
+			meta = json.load(f)
+		self.num_docs = meta['num_docs']
+		self.total_terms = meta['total_terms']
+		arrays = {name: np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r')
+				  for name in ['terms', 'term_offsets', 'df', 'cf', 'postings', 'postings_offsets', 'doc_lengths']}
+		self.postings = arrays['postings']
+		self.postings_offsets = arrays['postings_offsets']
+		self.df = arrays['df']
+		self.cf = arrays['cf']
+		self.doc_lengths = arrays['doc_lengths']
+		terms = arrays['terms'].tobytes()
+		term_offsets = arrays['term_offsets']
+		self.term2id = {terms[term_offsets[i]:term_offsets[i + 1]].decode('UTF-8'): i for i in range(len(self.df))}
+		self.doc_store = DocumentStore(os.path.join(index_dir, 'docs.bin'))
+
+	def get_postings(self, term_id):
+		"""
+		Decodes the postings list of a term.
+
+		Args:
+			term_id(int): The term ID.
+
+		Returns:
+			A tuple of two numpy arrays: the document IDs and the term frequencies.
+		"""
+		data = varbyte_decode(self.postings[self.postings_offsets[term_id]:self.postings_offsets[term_id + 1]])
+		df = len(data) // 2
+		return np.cumsum(data[:df]), data[df:]
+
+	def get_term_stats(self, term):
+		"""
+		Returns the document frequency and the collection frequency of a term (zero if the term does not exist).
+		"""
+		if term not in self.term2id:
+			return 0, 0
+		return int(self.df[self.term2id[term]]), int(self.cf[self.term2id[term]])
+
+	def get_term_postings(self, term):
+		"""
+		Returns the document IDs, term frequencies, and document lengths of the postings list of a term.
+		"""
+		if term not in self.term2id:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		doc_ids, tfs = self.get_postings(self.term2id[term])
+		return doc_ids, tfs, self.doc_lengths[doc_ids]
+
+	def get_docs(self, doc_ids):
+		return self.doc_store.get_docs(doc_ids)
+
+
+class MemorySegment:
+	def __init__(self):
+		"""
+		An in-memory index segment that documents can be added to. It has the same interface as NativeIndex.
+		"""
+		self.postings = dict()  # term -> (list of document IDs, list of term frequencies)
+		self.doc_lengths = []
+		self.docs = []
+		self.num_docs = 0
+		self.total_terms = 0
+
+	def add(self, doc):
+		term_counts = Counter(tokenize(doc.text))
+		for term, count in term_counts.items():
+			if term not in self.postings:
+				self.postings[term] = ([], [])
+			self.postings[term][0].append(self.num_docs)
+			self.postings[term][1].append(count)
+		self.doc_lengths.append(sum(term_counts.values()))
+		self.docs.append(doc)
+		self.num_docs += 1
+		self.total_terms += self.doc_lengths[-1]
+
+	def get_term_stats(self, term):
+		if term not in self.postings:
+			return 0, 0
+		return len(self.postings[term][0]), sum(self.postings[term][1])
+
+	def get_term_postings(self, term):
+		if term not in self.postings:
+			return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+		doc_ids = np.array(self.postings[term][0], dtype=np.int64)
+		return doc_ids, np.array(self.postings[term][1], dtype=np.int64), np.array(self.doc_lengths)[doc_ids]
+
+	def get_docs(self, doc_ids):
+		return [Document(self.docs[int(doc_id)].id, self.docs[int(doc_id)].title, self.docs[int(doc_id)].text, 0.)
+				if 0 <= int(doc_id) < self.num_docs else None for doc_id in doc_ids]
+
+
+class SegmentedIndex:
+	def __init__(self, index_dir):
+		"""
+		An index that documents can be added to while it is being searched. It consists of the on-disk segments (each a
+		NativeIndex) and an in-memory segment holding the recently added documents. The document IDs are global: the
+		documents of each segment are numbered after those of the previous segments, so an ID never changes.
+
+		The added documents are appended to a delta log in the index directory, and every process that searches the
+		index (e.g., each action worker) reads the new lines of the log into its own in-memory segment before each
+		query. Therefore, an added document is searchable right away in all processes and is not lost on restart.
+		'merge' moves the in-memory segment to a new on-disk segment and merges the small on-disk segments. The list
+		of segments and the current delta log are stored in 'segments.json', which is replaced atomically, and the
+		processes reload the segments when it changes. An index directory built by 'build_native_index' is a valid
+		segmented index with one segment.
+
+		Args:
+			index_dir(str): The index directory.
+		"""
+		self.index_dir = index_dir
+		self.manifest_path = os.path.join(index_dir, 'segments.json')
+		self.lock = threading.RLock()
+		self.manifest_version = None
+		self.refresh()
+
+	def read_manifest(self):
+		if os.path.exists(self.manifest_path):
+			with open(self.manifest_path) as f:
+				return json.load(f)
+		segments = ['.'] if os.path.exists(os.path.join(self.index_dir, 'meta.json')) else []
+		return {'generation': 0, 'segments': segments, 'delta': 'delta-0.jsonl', 'obsolete': []}
+
+	def write_manifest(self, manifest):
+		tmp_path = self.manifest_path + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump(manifest, f)
+		os.replace(tmp_path, self.manifest_path)
+
+	def refresh(self):
+		"""
+		Reloads the segments if they have changed, and reads the documents added to the delta log since the last call.
+		"""
+		with self.lock:
+			# The manifest is replaced by a new file, so its inode changes.
+			version = os.stat(self.manifest_path).st_ino if os.path.exists(self.manifest_path) else None
+			if self.manifest_version is None or version != self.manifest_version:
+				self.manifest = self.read_manifest()
+				self.segments = [NativeIndex(os.path.join(self.index_dir, name)) for name in self.manifest['segments']]
+				self.bases = [0]
+				for segment in self.segments:
+					self.bases.append(self.bases[-1] + segment.num_docs)
+				self.memory_segment = MemorySegment()
+				self.delta_offset = 0
+				self.manifest_version = version if version is not None else 0
+
+			delta_path = os.path.join(self.index_dir, self.manifest['delta'])
+			if os.path.exists(delta_path) and os.path.getsize(delta_path) > self.delta_offset:
+				with open(delta_path, 'rb') as f:
+					f.seek(self.delta_offset)
+					data = f.read()
+				data = data[:data.rfind(b'\n') + 1]  # a line that is being written is read next time
+				for line in data.splitlines():
+					fields = json.loads(line.decode('UTF-8'))
+					self.memory_segment.add(Document(fields['id'], fields['title'], fields['text'], 0.))
+				self.delta_offset += len(data)
+
+	def get_all_segments(self):
+		"""
+		Returns a list of (first document ID, segment) pairs, including the in-memory segment.
+		"""
+		with self.lock:
+			return list(zip(self.bases, self.segments + [self.memory_segment]))
+
+	def get_docs(self, doc_ids):
+		segments = self.get_all_segments()
+		docs = []
+		for doc_id in doc_ids:
+			base, segment = segments[bisect_right([base for base, segment in segments], int(doc_id)) - 1]
+			docs.append(segment.get_docs([int(doc_id) - base])[0])
+		return docs
+
+	def get_file_lock(self):
+		os.makedirs(self.index_dir, exist_ok=True)
+		lock_file = open(os.path.join(self.index_dir, 'lock'), 'a')
+		fcntl.flock(lock_file, fcntl.LOCK_EX)
+		return lock_file
+
+	def add_documents(self, docs):
+		"""
+		Adds documents to the index. The documents are searchable as soon as this method returns.
+
+		Args:
+			docs(list): A list of Documents, where Document.id is the external document ID.
+
+		Returns:
+			A list of the (global) document IDs of the added documents.
+		"""
+		with self.lock, self.get_file_lock():
+			self.refresh()
+			first_doc_id = self.bases[-1] + self.memory_segment.num_docs
+			lines = [json.dumps({'id': str(doc.id), 'title': str(doc.title), 'text': str(doc.text)}) + '\n'
+					 for doc in docs]
+			with open(os.path.join(self.index_dir, self.manifest['delta']), 'a', encoding='UTF-8') as f:
+				f.write(''.join(lines))
+			self.refresh()
+		return [str(doc_id) for doc_id in range(first_doc_id, first_doc_id + len(docs))]
+
+	def merge(self, max_segments):
+		"""
+		Writes the in-memory segment to a new on-disk segment, and if there are more than max_segments on-disk segments,
+		merges all of them except the first (which is usually the large initially built index) into one. The documents
+		keep their IDs. The searches are not blocked, but adding documents waits until the merge finishes.
+
+		Args:
+			max_segments(int): The maximum number of on-disk segments. Values smaller than 2 are treated as 2, because
+			the first segment is not merged.
+		"""
+		# Merging a single segment after the first one would only rewrite it.
+		max_segments = max(max_segments, 2)
+		with self.get_file_lock():
+			with self.lock:
+				self.refresh()
+				manifest = dict(self.manifest)
+				memory_segment = self.memory_segment
+				segments = list(zip(manifest['segments'], self.segments))
+			if memory_segment.num_docs == 0 and len(segments) <= max_segments:
+				return
+			generation = manifest['generation'] + 1
+			obsolete = []
+			if memory_segment.num_docs > 0:
+				name = 'segment-%d' % generation
+				build_native_index(memory_segment.docs, os.path.join(self.index_dir, name))
+				obsolete.append(manifest['delta'])
+				segments.append((name, None))
+			if len(segments) > max_segments:
+				name = 'segment-%d-merged' % generation
+				merged_docs = itertools.chain.from_iterable(
+					(self.read_segment_docs(segment_name) for segment_name, segment in segments[1:]))
+				build_native_index(merged_docs, os.path.join(self.index_dir, name))
+				obsolete += [segment_name for segment_name, segment in segments[1:]]
+				segments = segments[:1] + [(name, None)]
+
+			# The files that became obsolete in the previous merge are not used by any process anymore.
+			for name in manifest['obsolete']:
+				path = os.path.join(self.index_dir, name)
+				if os.path.isdir(path):
+					shutil.rmtree(path, ignore_errors=True)
+				elif os.path.exists(path):
+					os.remove(path)
+			self.write_manifest({'generation': generation,
+								 'segments': [segment_name for segment_name, segment in segments],
+								 'delta': 'delta-%d.jsonl' % generation,
+								 'obsolete': [name for name in obsolete if name != '.']})
+			self.refresh()
+
+	def read_segment_docs(self, name):
+		segment = NativeIndex(os.path.join(self.index_dir, name))
+		for doc in segment.get_docs(range(segment.num_docs)):
+			yield doc
+
+
+def build_native_index(docs, index_dir):
+	"""
+	Builds a native index.
+
+	Args:
+		docs(iterable): An iterable of Documents, where Document.id is the external document ID. The internal document
+		IDs are assigned in order, starting from 0.
+		index_dir(str): The index directory.
+
+	Returns:
+		The number of indexed documents.
+	"""
+	os.makedirs(index_dir, exist_ok=True)
+	postings = dict()  # term -> (list of document IDs, list of term frequencies)
+	doc_lengths = []
+
+	def index_docs():
+		for doc_id, doc in enumerate(docs):
+			term_counts = Counter(tokenize(doc.text))
+			for term, count in term_counts.items():
+				if term not in postings:
+					postings[term] = ([], [])
+				postings[term][0].append(doc_id)
+				postings[term][1].append(count)
+			doc_lengths.append(sum(term_counts.values()))
+			yield doc_id, doc
+
+	build_document_store(index_docs(), os.path.join(index_dir, 'docs.bin'))
+
+	terms = sorted(postings)
+	encoded_terms = [term.encode('UTF-8') for term in terms]
+	term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+	term_offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+	blocks = []
+	for term in terms:
+		doc_ids, tfs = postings[term]
+		blocks.append(varbyte_encode(np.diff(doc_ids, prepend=0).tolist() + tfs))
+	postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+	postings_offsets[1:] = np.cumsum([len(block) for block in blocks])
+	arrays = {'terms': np.frombuffer(b''.join(encoded_terms), dtype=np.uint8),
+			  'term_offsets': term_offsets,
+			  'df': np.array([len(postings[term][0]) for term in terms], dtype=np.int64),
+			  'cf': np.array([sum(postings[term][1]) for term in terms], dtype=np.int64),
+			  'postings': np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=np.uint8),
+			  'postings_offsets': postings_offsets,
+			  'doc_lengths': np.array(doc_lengths, dtype=np.int64)}
+	for name in arrays:
+		np.save(os.path.join(index_dir, name + '.npy'), arrays[name])
+	with open(os.path.join(index_dir, 'meta.json'), 'w') as f:
+		json.dump({'num_docs': len(doc_lengths), 'total_terms': int(sum(doc_lengths))}, f)
+	return len(doc_lengths)
+
+
+def iterate_trec_files(file_paths, format='trectext'):
+	"""
+	Reads and cleans the documents of trectext or trecweb files using core.retrieval.doc.get_trec_doc.
+
+	Args:
+		file_paths(list): A list of paths to trectext or trecweb files.
+		format(str): The document format. Either 'trectext' or 'trecweb'.
+
+	Returns:
+		A generator of Documents.
+	"""
+	for file_path in file_paths:
+		with open(file_path, encoding='UTF-8', errors='ignore') as f:
+			lines = []
+			for line in f:
+				lines.append(line)
+				if line.strip().lower().endswith('</doc>'):
+					yield get_trec_doc(''.join(lines), format)
+					lines = []
+
+
+class NativeSearch(Retrieval):
+	query_cache_params = ['index', 'results_requested', 'retrieval_model']
+	store_retrieved_docs = True
+
+	def __init__(self, params):
+		"""
+		A search engine implemented in Python and NumPy, which does not require any external service. Documents are
+		scored using either BM25 [Robertson et al.; TREC 1994] or the query likelihood retrieval model with Dirichlet
+		prior smoothing [Zhai and Lafferty; SIGIR 2001], vectorized over the postings lists of the query terms. The top
+		documents are selected with a partial sort. Documents can be added while the engine is running (see
+		'add_documents' and SegmentedIndex). The collection statistics are computed over all the segments, so the
+		scores are the same as if the index was built from scratch.
+
+		Args:
+			params(dict): A dict containing some parameters. Here is the list of all required parameters:
+			'index': The path to the index directory built by 'build_native_index'.
+			'results_requested': The maximum number of requested documents for retrieval. If not given, it is set to 1.
+			'retrieval_model': Either 'bm25' or 'dirichlet'. If not given, it is set to 'bm25'.
+			'bm25_k1', 'bm25_b', and 'dirichlet_mu' are optional hyper-parameters (default: 0.9, 0.4, and 2500).
+			'merge_interval': The number of seconds between the background merges of the index segments, started by
+			the first call of 'add_documents'. If not given, it is set to 60.
+			'max_segments': The maximum number of on-disk segments after a merge. If not given, it is set to 4.
+			Note that the parameters 'query_generation' and 'logger' are required by the parent class.
+		"""
+		super().__init__(params)
+		self.results_requested = self.params['results_requested'] if 'results_requested' in self.params else 1
+		self.retrieval_model = self.params['retrieval_model'] if 'retrieval_model' in self.params else 'bm25'
+		if self.retrieval_model not in ['bm25', 'dirichlet']:
+			raise Exception('The requested retrieval model does not exist!')
+		self.k1 = self.params['bm25_k1'] if 'bm25_k1' in self.params else 0.9
+		self.b = self.params['bm25_b'] if 'bm25_b' in self.params else 0.4
+		self.mu = self.params['dirichlet_mu'] if 'dirichlet_mu' in self.params else 2500
+		self.merge_interval = self.params['merge_interval'] if 'merge_interval' in self.params else 60
+		self.max_segments = self.params['max_segments'] if 'max_segments' in self.params else 4
+		self.index = SegmentedIndex(self.params['index'])
+		self.merge_thread = None
+		self.merge_thread_pid = None
+
+	def add_documents(self, docs):
+		"""
+		This method adds documents to the index. They are searchable right away, in all the processes that use the
+		index. The query result cache is cleared.
+
+		Args:
+			docs(list): A list of Documents, where Document.id is the external document ID.
+
+		Returns:
+			A list of the document IDs assigned to the added documents.
+		"""
+		with tracing.span('native.add_documents'):
+			doc_ids = self.index.add_documents(docs)
+		self.invalidate_query_cache()
+		if self.merge_thread is None or self.merge_thread_pid != os.getpid():
+			# Threads do not survive a fork, so the merges run in the process that adds the documents.
+			self.merge_thread = threading.Thread(target=self.merge_periodically, daemon=True)
+			self.merge_thread_pid = os.getpid()
+			self.merge_thread.start()
+		return doc_ids
+
+	def merge_periodically(self):
+		while True:
+			time.sleep(self.merge_interval)
+			try:
+				with tracing.span('native.merge'):
+					self.index.merge(self.max_segments)
+			except Exception as ex:
+				self.params['logger'].error('Merging the index segments failed: ' + str(ex))
+
+	def score(self, query):
+		"""
+		This method scores the documents that contain at least one of the query terms.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A tuple of two numpy arrays: the document IDs and their scores.
+		"""
+		self.index.refresh()
+		segments = self.index.get_all_segments()
+		num_docs = sum(segment.num_docs for base, segment in segments)
+		total_terms = sum(segment.total_terms for base, segment in segments)
+		term_stats = dict()  # term -> (document frequency, collection frequency)
+		for term in set(tokenize(query)):
+			stats = [segment.get_term_stats(term) for base, segment in segments]
+			if sum(df for df, cf in stats) > 0:
+				term_stats[term] = (sum(df for df, cf in stats), sum(cf for df, cf in stats))
+		query_term_counts = Counter(term for term in tokenize(query) if term in term_stats)
+		if len(query_term_counts) == 0 or num_docs == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0)
+		avg_doc_length = total_terms / num_docs
+		doc_id_list = []
+		length_list = []
+		score_list = []
+		constant = 0.
+		for term, query_tf in query_term_counts.items():
+			df, cf = term_stats[term]
+			postings = [segment.get_term_postings(term) for base, segment in segments]
+			doc_ids = np.concatenate([base + ids for (base, segment), (ids, tfs, lengths) in zip(segments, postings)])
+			tfs = np.concatenate([tfs for ids, tfs, lengths in postings])
+			doc_lengths = np.concatenate([lengths for ids, tfs, lengths in postings])
+			if self.retrieval_model == 'bm25':
+				idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+				length_norm = 1 - self.b + self.b * doc_lengths / avg_doc_length
+				scores = idf * tfs * (self.k1 + 1) / (tfs + self.k1 * length_norm)
+			else:
+				# log((tf + mu * p) / (dl + mu)) = log(1 + tf / (mu * p)) + log(mu / (dl + mu)) + log(p), where the last
+				# two terms do not depend on tf and are added for all the documents below.
+				p = cf / total_terms
+				scores = np.log1p(tfs / (self.mu * p))
+				constant += query_tf * math.log(p)
+			doc_id_list.append(doc_ids)
+			length_list.append(doc_lengths)
+			score_list.append(query_tf * scores)
+
+		doc_ids, first, inverse = np.unique(np.concatenate(doc_id_list), return_index=True, return_inverse=True)
+		scores = np.bincount(inverse, weights=np.concatenate(score_list))
+		if self.retrieval_model == 'dirichlet':
+			query_length = sum(query_term_counts.values())
+			scores += constant + query_length * np.log(self.mu / (np.concatenate(length_list)[first] + self.mu))
+		return doc_ids, scores
+
+	def retrieve(self, query):
+		"""
+		This method retrieve documents in response to the given query.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of Documents with the maximum length of the 'results_requested' parameter.
+		"""
+		id_results = self.retrieve_ids(query)
+		docs = self.get_docs([doc_id for doc_id, score in id_results])
+		results = []
+		for doc, (doc_id, score) in zip(docs, id_results):
+			if doc is None:  # the document is missing from the document store
+				continue
+			doc.score = score
+			results.append(doc)
+		return results
+
+	def retrieve_ids(self, query):
+		"""
+		This method returns the IDs and scores of the top documents, without reading the documents.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of (document ID, score) pairs with the maximum length of the 'results_requested' parameter.
+		"""
+		with tracing.span('native.score'):
+			doc_ids, scores = self.score(query)
+			k = min(self.results_requested, len(doc_ids))
+			top = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.zeros(0, dtype=np.int64)
+			top = top[np.lexsort((doc_ids[top], -scores[top]))]  # ties are broken by document ID
+		return [(str(doc_ids[i]), float(scores[i])) for i in top]
+
+	def get_docs(self, doc_ids):
+		"""
+		This method reads the documents for a list of document ids from the document store.
+
+		Args:
+			doc_ids(list): A list of document IDs.
+
+		Returns:
+			A list of Documents (or None for the missing ones), in the same order as doc_ids.
+		"""
+		self.index.refresh()
+		docs = self.index.get_docs(doc_ids)
+		for doc, doc_id in zip(docs, doc_ids):
+			if doc is not None:
+				doc.id = str(doc_id)
+		return docs
+
+	def get_doc_from_index(self, doc_id):
+		"""
+		This method retrieves a document content for a given document id.
+
+		Args:
+			doc_id(str): The document ID.
+
+		Returns:
+			A Document from the collection whose ID is equal to the given doc_id. For some reasons, the method returns
+			a list of Documents with a length of 1. An empty list is returned if there is no document with this ID.
+		"""
+		if not str(doc_id).strip().isdigit():
+			return []
+		return [doc for doc in self.get_docs([str(doc_id).strip()]) if doc is not None]
+
+
+if __name__ == '__main__':
+	# Builds a native index from trectext or trecweb files.
+	params = {'trec_files': ['PATH_TO_TREC_FILE'],
+			  'format': 'trectext',
+			  'index': 'PATH_TO_NATIVE_INDEX'}
+	print(build_native_index(iterate_trec_files(params['trec_files'], params['format']), params['index']),
+		  'documents are indexed.')
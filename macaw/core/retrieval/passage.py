@@ -0,0 +1,114 @@
+"""
+Passage retrieval: splitting the retrieved documents into passages and ranking the passages.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from collections import Counter
+import math
+
+from macaw.core.retrieval.doc import Document, LazyDocument
+from macaw.core.retrieval.native import tokenize
+from macaw.core.retrieval.search_engine import ReRanker
+
+
+def split_passages(doc, passage_length=100, passage_stride=50):
+    """
+    Splits a document into overlapping passages of words. The text of a LazyDocument that has not been loaded is not
+    loaded here (e.g., a Web page is not downloaded), and its snippet is split instead.
+
+    Args:
+        doc(Document): The document.
+        passage_length(int): The maximum number of words in each passage.
+        passage_stride(int): The number of words between the starts of two consecutive passages. If it is smaller than
+        passage_length, the passages overlap.
+
+    Returns:
+        A list of Documents. The ID of each passage is the document ID followed by '#' and the passage number, and its
+        parent_id is the document ID. A document that is not longer than passage_length is a single passage, and a
+        document without any text has no passages.
+    """
+    if passage_length <= 0 or passage_stride <= 0:
+        raise Exception('The passage length and stride should be positive!')
+    text = doc.snippet if isinstance(doc, LazyDocument) and not doc.is_loaded() else doc.text
+    words = text.split() if text is not None else []
+    if len(words) == 0:
+        return []
+    starts = range(0, max(len(words) - passage_length, 0) + 1, passage_stride)
+    if len(words) > passage_length and starts[-1] + passage_length < len(words):
+        starts = list(starts) + [len(words) - passage_length]  # the last words are always in a passage
+    return [Document('%s#%d' % (doc.id, i), doc.title, ' '.join(words[start:start + passage_length]), doc.score,
+                     parent_id=doc.id) for i, start in enumerate(starts)]
+
+
+class PassageRanker(ReRanker):
+    def __init__(self, params):
+        """
+        A re-ranking model that returns the best passages of the retrieved documents instead of the documents, so
+        that the next steps (e.g., the MRC model of the question answering action) read a few hundred words instead of
+        the whole documents. The passages are scored by BM25, with the statistics computed over all the passages of
+        the result list. Ties are broken by the rank of their documents.
+
+        The passages are built at query time from the retrieved documents, rather than indexed ahead of time, so the
+        passage mode works with every search engine (including Bing) and index without rebuilding it. The cost is
+        splitting and scoring the top documents of each query. The lazy documents that have not been loaded (e.g.,
+        the Bing result pages with 'bing_lazy_pages') are represented by the passages of their snippets, so ranking
+        the passages does not download any page.
+
+        Args:
+            params(dict): A dict containing some parameters. All of them are optional:
+            'passage_length': The maximum number of words in each passage. The default value is 100.
+            'passage_stride': The number of words between the starts of two consecutive passages. The default value is
+            50, i.e., the passages overlap by half.
+            'passages_requested': The maximum number of returned passages. The default value is 'results_requested'
+            of the retrieval model.
+            'reranker': A ReRanker that re-ranks the documents before they are split into passages.
+        """
+        super().__init__(params)
+        self.passage_length = self.params['passage_length'] if 'passage_length' in self.params else 100
+        self.passage_stride = self.params['passage_stride'] if 'passage_stride' in self.params else 50
+        if self.passage_length <= 0 or self.passage_stride <= 0:
+            raise Exception('The passage length and stride should be positive!')
+        self.k1 = 0.9
+        self.b = 0.4
+
+    def rerank(self, query, conv_list, result_list, params):
+        """
+        This method splits the documents in result_list into passages and returns the top passages.
+
+        Args:
+            query(str): A query generated by a query generation model
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            result_list(list): A list of Documents retrieved by a first stage retrieval model.
+            params(dict): The parameters of the retrieval model.
+
+        Returns:
+            A list of passages (Documents whose parent_id is the ID of their document), sorted by their scores.
+        """
+        if 'reranker' in self.params and self.params['reranker'] is not None:
+            result_list = self.params['reranker'].rerank(query, conv_list, result_list, params)
+        if 'passages_requested' in self.params:
+            passages_requested = self.params['passages_requested']
+        else:
+            passages_requested = params['results_requested'] if 'results_requested' in params else 1
+
+        passages = []
+        for doc in result_list:
+            passages += split_passages(doc, self.passage_length, self.passage_stride)
+        if len(passages) == 0:
+            return []
+        term_counts = [Counter(tokenize(passage.text)) for passage in passages]
+        avg_length = max(sum(sum(counts.values()) for counts in term_counts) / len(passages), 1.)
+        df = Counter(term for counts in term_counts for term in counts)
+        query_term_counts = Counter(tokenize(query))
+        for passage, counts in zip(passages, term_counts):
+            length_norm = 1 - self.b + self.b * sum(counts.values()) / avg_length
+            passage.score = 0.
+            for term, query_tf in query_term_counts.items():
+                tf = counts[term]
+                if tf > 0:
+                    idf = math.log(1 + (len(passages) - df[term] + 0.5) / (df[term] + 0.5))
+                    passage.score += query_tf * idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        # sorted is stable, so the passages with equal scores stay in the order of their documents.
+        return sorted(passages, key=lambda passage: -passage.score)[:passages_requested]
@@ -7,6 +7,9 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 from abc import ABC, abstractmethod
 import string
 
+from macaw import util
+from macaw.util import tracing
+
 
 class QueryGeneration(ABC):
     @abstractmethod
@@ -33,6 +36,20 @@ class QueryGeneration(ABC):
         """
         pass
 
+    async def get_query_async(self, conv_list):
+        """
+        The async counterpart of 'get_query'. By default, it runs 'get_query' (e.g., CoreNLP co-reference resolution) in
+        an executor.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+
+        Returns:
+            A str containing a query for retrieval purpose.
+        """
+        return await util.run_in_executor(self.get_query, conv_list)
+
 
 class SimpleQueryGeneration(QueryGeneration):
     def __init__(self, params):
@@ -82,7 +99,8 @@ class SimpleQueryGeneration(QueryGeneration):
             A dict from terms in the last user request to a list of all identified co-references.
 
         """
-        corenlp_coref_result = self.compute_corefs(conv_list)
+        with tracing.span('query_generation.corenlp_coref'):
+            corenlp_coref_result = self.compute_corefs(conv_list)
         q_coref = dict()
         last_index = len(corenlp_coref_result['sentences'])
         for key in corenlp_coref_result['corefs']:
@@ -0,0 +1,227 @@
+"""
+Client-side rate limiting and request coalescing for the Web APIs that are shared by all Macaw processes.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+import fcntl
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+
+class ProcessLock:
+    def __init__(self):
+        """
+        A lock shared by the processes forked after it is created and by their threads. It is a POSIX record lock on an
+        anonymous temporary file, which the kernel releases when the owner process exits. So, unlike a
+        multiprocessing.Lock, it is never left locked by a process that is killed while holding it (e.g., an action
+        worker terminated by the request dispatcher). Record locks are owned by processes, so the threads of each
+        process are serialized by a threading.Lock, which is re-created in the forked processes.
+        """
+        self.file = tempfile.TemporaryFile()
+        self.thread_lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.reset_thread_lock)
+
+    def reset_thread_lock(self):
+        self.thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            fcntl.lockf(self.file, fcntl.LOCK_EX)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.lockf(self.file, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, max_wait=5.):
+        """
+        A token bucket rate limiter whose state is in shared memory, so that it limits the total rate of all the
+        processes forked after it is created (e.g., the action worker processes of the request dispatcher). Each call
+        takes a token, and the tokens are refilled at the given rate up to the burst size. The state is guarded by a
+        ProcessLock, so a process killed while updating it does not block the others.
+
+        Args:
+            rate(float): The number of tokens added per second, i.e., the maximum sustained number of calls per second.
+            burst(int): The maximum number of tokens in the bucket. If not given, it is equal to rate (at least 1).
+            max_wait(float): The maximum time that a call waits for a token (in seconds).
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.)
+        self.max_wait = max_wait
+        self.lock = ProcessLock()
+        # tokens, last refill time, and the numbers of calls, calls that waited, calls that timed out, and penalties
+        self.state = multiprocessing.get_context('fork').RawArray('d', [self.burst, time.monotonic(), 0, 0, 0, 0])
+
+    def acquire(self):
+        """
+        Takes a token, waiting for at most 'max_wait' seconds.
+
+        Returns:
+            True if a token is taken, and False if the wait has timed out.
+        """
+        deadline = time.monotonic() + self.max_wait
+        waited = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.state[0] = min(self.burst, self.state[0] + (now - self.state[1]) * self.rate)
+                self.state[1] = now
+                if self.state[0] >= 1:
+                    self.state[0] -= 1
+                    self.state[2] += 1
+                    self.state[3] += waited
+                    return True
+                wait_time = (1 - self.state[0]) / self.rate
+                if now + wait_time > deadline:
+                    self.state[4] += 1
+                    return False
+            waited = True
+            time.sleep(wait_time)
+
+    def penalize(self, seconds):
+        """
+        Empties the bucket for the given number of seconds, e.g., after the API has responded with '429 Too Many
+        Requests' and a 'Retry-After' header.
+        """
+        with self.lock:
+            self.state[0] = min(self.state[0], -seconds * self.rate)
+            self.state[5] += 1
+
+    def get_stats(self):
+        """
+        Returns a dict containing the number of 'calls', 'throttled' calls (the calls that waited for a token),
+        'rejected' calls (the calls that could not get a token in time), and 'penalties'.
+        """
+        with self.lock:
+            return {'calls': int(self.state[2]), 'throttled': int(self.state[3]), 'rejected': int(self.state[4]),
+                    'penalties': int(self.state[5])}
+
+
+class RequestCoalescer:
+    def __init__(self, max_wait=30., lock_timeout=5.):
+        """
+        Coalesces identical concurrent calls, so that only the first one (the leader) runs and the others wait for its
+        result. The in-flight calls and their results are kept in a multiprocessing Manager, so identical calls are
+        coalesced across the processes forked after the coalescer is created, as well as across threads. Note that the
+        Manager is an extra server process started here, and every access to the shared state is an IPC round trip to
+        it. A call makes a few of them (well below a millisecond in total), which is small compared to a Web API call,
+        but the coalescer is not meant for cheap calls.
+
+        Each in-flight call is recorded with the process ID and the start time of its leader. A waiting call takes the
+        call over, i.e., runs it by itself and publishes the result like a leader, if the leader process has died
+        (e.g., an action worker terminated by the request dispatcher) or the call has not finished in max_wait.
+
+        Args:
+            max_wait(float): The maximum time that a call waits for the result of an identical call (in seconds). After
+            that, it takes the call over.
+            lock_timeout(float): The maximum time that a call waits for the lock of the shared state (in seconds). The
+            lock may be left locked by a process killed while holding it, so after that, the call runs by itself
+            without being coalesced.
+        """
+        self.max_wait = max_wait
+        self.lock_timeout = lock_timeout
+        self.manager = multiprocessing.get_context('fork').Manager()
+        self.in_flight = self.manager.dict()  # key -> (call ID, process ID of the leader, start time)
+        self.results = self.manager.dict()  # call ID -> (time, True and the result, or False and the error message)
+        self.condition = self.manager.Condition()
+        self.stats = self.manager.dict({'coalesced': 0, 'taken_over': 0})
+
+    def call(self, key, func):
+        """
+        Runs func, unless an identical call (with the same key) is in flight, in which case its result is returned.
+
+        Args:
+            key(str): The key that identifies identical calls.
+            func(callable): A function without arguments whose result is picklable.
+
+        Returns:
+            The result of func.
+        """
+        if not self.condition.acquire(True, self.lock_timeout):
+            return func()
+        try:
+            followed_call_ids = []
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                for followed_call_id in followed_call_ids:
+                    if followed_call_id in self.results:
+                        succeeded, result = self.results[followed_call_id][1:]
+                        if succeeded:
+                            return result
+                        raise Exception('The coalesced call failed: ' + result)
+                entry = self.in_flight.get(key)
+                if entry is None or self.is_abandoned(entry) or time.monotonic() >= deadline:
+                    if entry is not None:
+                        self.stats['taken_over'] += 1
+                    call_id = uuid.uuid4().hex
+                    self.in_flight[key] = (call_id, os.getpid(), time.monotonic())
+                    break
+                if len(followed_call_ids) == 0:
+                    self.stats['coalesced'] += 1
+                if entry[0] not in followed_call_ids:
+                    followed_call_ids.append(entry[0])
+                # The leader is checked at least once a second, since a dead leader does not notify the waiting calls.
+                self.condition.wait(max(min(deadline - time.monotonic(), 1.), 0.))
+        finally:
+            self.condition.release()
+
+        outcome = (time.monotonic(), False, 'The call was interrupted.')
+        try:
+            result = func()
+            outcome = (time.monotonic(), True, result)
+            return result
+        except Exception as ex:
+            outcome = (time.monotonic(), False, str(ex))
+            raise
+        finally:
+            # If the lock is not available, the waiting calls take this call over when it becomes stale.
+            if self.condition.acquire(True, self.lock_timeout):
+                try:
+                    # The results are kept for a short time, so that all the waiting calls can read them.
+                    for old_call_id, old_outcome in list(self.results.items()):
+                        if old_outcome[0] < time.monotonic() - self.max_wait:
+                            del self.results[old_call_id]
+                    self.results[call_id] = outcome
+                    entry = self.in_flight.get(key)
+                    if entry is not None and entry[0] == call_id:
+                        del self.in_flight[key]
+                    self.condition.notify_all()
+                finally:
+                    self.condition.release()
+
+    def is_abandoned(self, entry):
+        """
+        Returns whether an in-flight call should be taken over, i.e., its leader process has died or the call has been
+        running for more than max_wait.
+
+        Args:
+            entry(tuple): The (call ID, process ID of the leader, start time) of the call.
+        """
+        call_id, pid, start_time = entry
+        if time.monotonic() - start_time > self.max_wait:
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def get_stats(self):
+        """
+        Returns a dict containing the number of 'coalesced' calls, i.e., the calls that waited for an identical call,
+        and the number of calls 'taken_over' from a dead or stale leader.
+        """
+        return dict(self.stats)
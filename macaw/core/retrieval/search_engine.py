@@ -6,8 +6,19 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 
 from abc import ABC, abstractmethod
 
+from macaw import util
+from macaw.util import tracing
+
 
 class Retrieval(ABC):
+	# The parameters that change the retrieval results, used in the query cache keys.
+	query_cache_params = ['results_requested']
+	# Whether the retrieved documents can be kept by the dispatcher to serve '#get_doc' (see
+	# interaction_handler.result_store), i.e., they are the documents that 'get_doc_from_index' returns. Retrieval
+	# models whose '#get_doc' output is different (e.g., Bing returns the URL) or whose documents are loaded lazily
+	# should not opt in.
+	store_retrieved_docs = False
+
 	@abstractmethod
 	def __init__(self, params):
 		"""
@@ -15,10 +26,17 @@ class Retrieval(ABC):
 
 		Args:
 			params(dict): A dict containing some mandatory and optional parameters. 'query_generation' and 'logger' are
-			required for all retrieval models.
+			required for all retrieval models. 'doc_cache' is optional and is a core.retrieval.cache.Cache for the
+			fetched documents (see 'get_cached_docs'). 'query_cache' is optional and is a core.retrieval.cache.Cache for
+			the retrieval results of the generated queries (see 'cached_retrieve'). Empty result lists are cached for
+			'query_cache_negative_ttl' seconds (optional, default: 60).
 		"""
 		self.params = params
 		self.query_generation = self.params['query_generation']
+		self.doc_cache = self.params['doc_cache'] if 'doc_cache' in self.params else None
+		self.query_cache = self.params['query_cache'] if 'query_cache' in self.params else None
+		self.query_cache_negative_ttl = self.params['query_cache_negative_ttl'] \
+			if 'query_cache_negative_ttl' in self.params else 60
 
 	@abstractmethod
 	def retrieve(self, query):
@@ -30,6 +48,180 @@ class Retrieval(ABC):
 		"""
 		pass
 
+	async def retrieve_async(self, query):
+		"""
+		The async counterpart of 'retrieve'. By default, it runs 'retrieve' in an executor. Search engines with a
+		non-blocking client can override this method.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of Documents.
+		"""
+		return await util.run_in_executor(self.retrieve, query)
+
+	def retrieve_many(self, queries):
+		"""
+		This method retrieves documents for a batch of queries. By default, the queries are retrieved one by one.
+		Search engines that support batched lookups should override this method.
+
+		Args:
+			queries(list): A list of query strings.
+
+		Returns:
+			A list of lists of Documents, in the same order as the queries.
+		"""
+		return [self.retrieve(query) for query in queries]
+
+	def retrieve_ids(self, query):
+		"""
+		This method returns the IDs and scores of the retrieved documents, i.e., the first phase of a two-phase
+		retrieval, in which only the documents that are finally needed are fetched using 'get_docs'. By default, it
+		runs 'retrieve'. Search engines that can rank documents without reading them should override this method.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of (document ID, score) pairs.
+		"""
+		return [(doc.id, doc.score) for doc in self.retrieve(query)]
+
+	def get_docs(self, doc_ids):
+		"""
+		This method retrieves the documents for a list of document ids. By default, the documents are fetched one by
+		one using 'get_doc_from_index'. Search engines that support batched document lookups should override this
+		method.
+
+		Args:
+			doc_ids(list): A list of document IDs.
+
+		Returns:
+			A list of Documents, in the same order as doc_ids.
+		"""
+		return [self.get_doc_from_index(doc_id)[0] for doc_id in doc_ids]
+
+	def get_query_cache_key(self, query):
+		"""
+		This method returns the query cache key, which contains the search engine, its parameters that change the
+		results, and the normalized query.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A str key.
+		"""
+		engine_params = [str(self.params[key]) if key in self.params else '' for key in self.query_cache_params]
+		return '\t'.join([self.__class__.__name__] + engine_params + [' '.join(query.lower().split())])
+
+	def cached_retrieve(self, query):
+		"""
+		This method returns the retrieval results of a query from the query cache, if available. Otherwise, it runs
+		'retrieve' and adds the results to the cache. The results are cached before re-ranking, since the re-ranker
+		depends on the conversation.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of Documents.
+		"""
+		if self.query_cache is None:
+			return self.retrieve(query)
+		key = self.get_query_cache_key(query)
+		result_list = self.query_cache.get(key)
+		if result_list is None:
+			result_list = self.retrieve(query)
+			self.put_query_results(key, result_list)
+		return result_list
+
+	def put_query_results(self, key, result_list):
+		# Empty result lists are cached for a shorter time (negative caching).
+		self.query_cache.put(key, result_list, self.query_cache_negative_ttl if len(result_list) == 0 else None)
+
+	def cached_retrieve_many(self, queries):
+		"""
+		The batch counterpart of 'cached_retrieve'. Only the queries missing from the query cache are retrieved, using
+		'retrieve_many'.
+
+		Args:
+			queries(list): A list of query strings.
+
+		Returns:
+			A list of lists of Documents, in the same order as the queries.
+		"""
+		if self.query_cache is None:
+			return self.retrieve_many(queries)
+		keys = [self.get_query_cache_key(query) for query in queries]
+		result_lists = [self.query_cache.get(key) for key in keys]
+		missing = dict()  # key -> the first index of the key, so duplicate queries in the batch are retrieved once
+		for i in range(len(queries)):
+			if result_lists[i] is None and keys[i] not in missing:
+				missing[keys[i]] = i
+		if len(missing) > 0:
+			retrieved = dict(zip(missing, self.retrieve_many([queries[i] for i in missing.values()])))
+			for key in retrieved:
+				self.put_query_results(key, retrieved[key])
+			result_lists = [retrieved[keys[i]] if result_lists[i] is None else result_lists[i]
+							for i in range(len(queries))]
+		return result_lists
+
+	async def cached_retrieve_async(self, query):
+		"""
+		The async counterpart of 'cached_retrieve'.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of Documents.
+		"""
+		if self.query_cache is None:
+			return await self.retrieve_async(query)
+		key = self.get_query_cache_key(query)
+		result_list = self.query_cache.get(key)
+		if result_list is None:
+			result_list = await self.retrieve_async(query)
+			self.put_query_results(key, result_list)
+		return result_list
+
+	def invalidate_query_cache(self):
+		"""
+		This method removes all the cached retrieval results. It should be called whenever the index changes.
+		"""
+		if self.query_cache is not None:
+			self.query_cache.clear()
+
+	def get_cached_docs(self, keys, fetch_func, ttl=None):
+		"""
+		This method looks up documents in the document cache and only fetches the missing ones. Retrieval models opt in
+		to the document cache by fetching their documents through this method. Without a document cache, all the
+		documents are fetched.
+
+		Args:
+			keys(list): A list of cache keys, one per document. The keys should be unique across retrieval models and
+			collections that share the cache.
+			fetch_func(callable): A function that gets the list of the indices of the missing keys and returns the
+			list of their Documents.
+			ttl(float): The time to live of the fetched documents in the cache (in seconds). If not given, the default
+			TTL of the cache is used.
+
+		Returns:
+			A list of Documents, in the same order as keys.
+		"""
+		if self.doc_cache is None:
+			return fetch_func(list(range(len(keys))))
+		docs = [self.doc_cache.get(key) for key in keys]
+		missing = [i for i in range(len(keys)) if docs[i] is None]
+		if len(missing) > 0:
+			for i, doc in zip(missing, fetch_func(missing)):
+				docs[i] = doc
+				if doc is not None:
+					self.doc_cache.put(keys[i], doc, ttl)
+		return docs
+
 	def get_results(self, conv_list):
 		"""
 		This method is the one that should be called. It simply calls the query generation model to generate a query
@@ -41,11 +233,59 @@ class Retrieval(ABC):
 		Returns:
 			A list of Documents retrieved by the search engine.
 		"""
-		query = self.query_generation.get_query(conv_list)
+		with tracing.span('retrieval.query_generation'):
+			query = self.query_generation.get_query(conv_list)
+		self.params['logger'].info('New query: ' + query)
+		with tracing.span('retrieval.retrieve'):
+			result_list = self.cached_retrieve(query)
+		if 'reranker' in self.params and self.params['reranker'] is not None:
+			with tracing.span('retrieval.rerank'):
+				return self.params['reranker'].rerank(query, conv_list, result_list, self.params)
+		return result_list
+
+	def get_results_many(self, conv_lists):
+		"""
+		The batch counterpart of 'get_results'. It generates a query for each conversation and then retrieves the
+		results for all of them using 'retrieve_many'.
+
+		Args:
+			conv_lists(list): A list of conversations, each a list of util.msg.Message in reverse order.
+
+		Returns:
+			A list of lists of Documents, in the same order as the conversations.
+		"""
+		with tracing.span('retrieval.query_generation'):
+			queries = [self.query_generation.get_query(conv_list) for conv_list in conv_lists]
+		self.params['logger'].info('New batch of %d queries.', len(queries))
+		with tracing.span('retrieval.retrieve_many'):
+			result_lists = self.cached_retrieve_many(queries)
+		if 'reranker' in self.params and self.params['reranker'] is not None:
+			with tracing.span('retrieval.rerank'):
+				return [self.params['reranker'].rerank(query, conv_list, result_list, self.params)
+						for (query, conv_list, result_list) in zip(queries, conv_lists, result_lists)]
+		return result_lists
+
+	async def get_results_async(self, conv_list):
+		"""
+		The async counterpart of 'get_results'. Query generation and retrieval are awaited, and re-ranking is run in an
+		executor.
+
+		Args:
+			conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+			user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+
+		Returns:
+			A list of Documents retrieved by the search engine.
+		"""
+		with tracing.span('retrieval.query_generation'):
+			query = await self.query_generation.get_query_async(conv_list)
 		self.params['logger'].info('New query: ' + query)
-		result_list = self.retrieve(query)
-		if 'reranker' in self.params:
-			return self.params['reranker'].rerank(query, conv_list, result_list, self.params)
+		with tracing.span('retrieval.retrieve'):
+			result_list = await self.cached_retrieve_async(query)
+		if 'reranker' in self.params and self.params['reranker'] is not None:
+			with tracing.span('retrieval.rerank'):
+				return await util.run_in_executor(self.params['reranker'].rerank, query, conv_list, result_list,
+												  self.params)
 		return result_list
 
 
@@ -0,0 +1,274 @@
+"""
+Scatter-gather retrieval over multiple index shards.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from multiprocessing.connection import Client, Listener
+import multiprocessing
+import os
+import tempfile
+import threading
+import traceback
+import uuid
+
+from macaw.core.retrieval.search_engine import Retrieval
+from macaw.util import tracing
+
+
+def normalize_scores(scores, method):
+	"""
+	Normalizes the scores of a result list, so that the scores of different shards are comparable.
+
+	Args:
+		scores(list): A list of float scores.
+		method(str): 'minmax', 'zscore', or 'none'.
+
+	Returns:
+		A list of normalized scores.
+	"""
+	if method == 'none' or len(scores) == 0:
+		return list(scores)
+	elif method == 'minmax':
+		low, high = min(scores), max(scores)
+		return [(score - low) / (high - low) if high > low else 1. for score in scores]
+	elif method == 'zscore':
+		mean = sum(scores) / len(scores)
+		std = (sum((score - mean) ** 2 for score in scores) / len(scores)) ** 0.5
+		return [(score - mean) / std if std > 0 else 0. for score in scores]
+	else:
+		raise Exception('The requested score normalization method does not exist!')
+
+
+class ShardedRetrieval(Retrieval):
+	def __init__(self, params):
+		"""
+		A retrieval model that searches multiple shards of a collection in parallel, each shard being a Retrieval
+		object (e.g., an Indri index or a RemoteRetrieval). Retrieval has two phases. First, each shard returns the IDs
+		and scores of its top documents (see Retrieval.retrieve_ids). Then, the scores are normalized per shard, the
+		top documents are merged, and only the final top documents are fetched from their shards. Document IDs are
+		prefixed with the shard number, e.g., '2:1234'. A shard that fails is logged and ignored.
+
+		Args:
+			params(dict): A dict containing some parameters. Here is the list of all required parameters:
+			'shards': A list of Retrieval objects.
+			'results_requested': The maximum number of requested documents for retrieval. If not given, it is set to 1.
+			'score_normalization': 'minmax', 'zscore', or 'none'. If not given, it is set to 'minmax'.
+			Note that the parameters 'query_generation' and 'logger' are required by the parent class.
+		"""
+		super().__init__(params)
+		self.shards = self.params['shards']
+		self.store_retrieved_docs = all(shard.store_retrieved_docs for shard in self.shards)
+		self.results_requested = self.params['results_requested'] if 'results_requested' in self.params else 1
+		self.score_normalization = self.params['score_normalization'] if 'score_normalization' in self.params \
+			else 'minmax'
+		self.executor = None  # created on the first use, in the process that uses it
+		self.executor_pid = None
+		self.executor_lock = threading.Lock()
+
+	def get_executor(self):
+		# Threads do not survive a fork, so each action worker process creates its own executor.
+		with self.executor_lock:
+			if self.executor is None or self.executor_pid != os.getpid():
+				self.executor = ThreadPoolExecutor(max_workers=len(self.shards))
+				self.executor_pid = os.getpid()
+			return self.executor
+
+	def call_shards(self, func, shard_ids):
+		"""
+		Runs a function on multiple shards in parallel.
+
+		Args:
+			func(callable): A function that gets the shard ID and returns the shard's result.
+			shard_ids(list): A list of shard IDs.
+
+		Returns:
+			A dict from shard ID to the result. The shards that failed are not included.
+		"""
+		# Each shard runs in a copy of the caller's context, so its tracing spans belong to the caller's request.
+		futures = dict((shard_id, self.get_executor().submit(contextvars.copy_context().run, func, shard_id))
+					   for shard_id in shard_ids)
+		results = dict()
+		for shard_id in futures:
+			try:
+				results[shard_id] = futures[shard_id].result()
+			except Exception:
+				self.params['logger'].warning('The shard %d failed: %s', shard_id, traceback.format_exc())
+		return results
+
+	@staticmethod
+	def split_doc_id(doc_id):
+		shard_id, shard_doc_id = str(doc_id).split(':', 1)
+		return int(shard_id), shard_doc_id
+
+	def retrieve_ids(self, query):
+		"""
+		This method returns the prefixed IDs and normalized scores of the merged top documents.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of (document ID, score) pairs with the maximum length of the 'results_requested' parameter.
+		"""
+		with tracing.span('sharded.retrieve_ids'):
+			shard_results = self.call_shards(lambda shard_id: self.shards[shard_id].retrieve_ids(query),
+											 list(range(len(self.shards))))
+		candidates = []
+		for shard_id in shard_results:
+			scores = normalize_scores([score for doc_id, score in shard_results[shard_id]], self.score_normalization)
+			for (doc_id, raw_score), score in zip(shard_results[shard_id], scores):
+				candidates.append((score, shard_id, doc_id))
+		candidates.sort(key=lambda candidate: -candidate[0])
+		return [('%d:%s' % (shard_id, doc_id), score)
+				for score, shard_id, doc_id in candidates[:self.results_requested]]
+
+	def get_docs(self, doc_ids):
+		"""
+		This method fetches the documents for a list of prefixed document ids from their shards in parallel.
+
+		Args:
+			doc_ids(list): A list of prefixed document IDs.
+
+		Returns:
+			A list of Documents (or None if the shard failed), in the same order as doc_ids.
+		"""
+		shard_doc_ids = dict()  # shard ID -> list of (index in doc_ids, document ID in the shard)
+		for i, doc_id in enumerate(doc_ids):
+			shard_id, shard_doc_id = self.split_doc_id(doc_id)
+			shard_doc_ids.setdefault(shard_id, []).append((i, shard_doc_id))
+		with tracing.span('sharded.get_docs'):
+			shard_docs = self.call_shards(lambda shard_id: self.shards[shard_id].get_docs(
+				[shard_doc_id for i, shard_doc_id in shard_doc_ids[shard_id]]), list(shard_doc_ids))
+		docs = [None] * len(doc_ids)
+		for shard_id in shard_docs:
+			for (i, shard_doc_id), doc in zip(shard_doc_ids[shard_id], shard_docs[shard_id]):
+				if doc is not None:
+					doc.id = str(doc_ids[i])
+				docs[i] = doc
+		return docs
+
+	def retrieve(self, query):
+		"""
+		This method retrieve documents in response to the given query.
+
+		Args:
+			query(str): The query string.
+
+		Returns:
+			A list of Documents with the maximum length of the 'results_requested' parameter.
+		"""
+		id_results = self.retrieve_ids(query)
+		results = []
+		for doc, (doc_id, score) in zip(self.get_docs([doc_id for doc_id, score in id_results]), id_results):
+			if doc is not None:
+				doc.score = score
+				results.append(doc)
+		return results
+
+	def get_doc_from_index(self, doc_id):
+		"""
+		This method retrieves a document content for a given prefixed document id.
+
+		Args:
+			doc_id(str): The document ID.
+
+		Returns:
+			A Document from the collection whose ID is equal to the given doc_id. For some reasons, the method returns
+			a list of Documents with a length of 1.
+		"""
+		return self.get_docs([doc_id])
+
+
+def serve_retrieval(retrieval_factory, params, address, authkey, ready):
+	"""
+	The main function of a RemoteRetrieval server process. Each client connection is served by a thread, and the
+	requests are run one at a time.
+	"""
+	retrieval = retrieval_factory(params)
+	lock = threading.Lock()
+	listener = Listener(address, family='AF_UNIX', authkey=authkey)
+	ready.set()
+
+	def serve_connection(conn):
+		try:
+			while True:
+				method, args = conn.recv()
+				try:
+					with lock:
+						conn.send(('result', getattr(retrieval, method)(*args)))
+				except Exception:
+					conn.send(('error', traceback.format_exc()))
+		except (EOFError, OSError):
+			conn.close()
+
+	while True:
+		conn = listener.accept()
+		threading.Thread(target=serve_connection, args=[conn], daemon=True).start()
+
+
+class RemoteRetrieval(Retrieval):
+	def __init__(self, retrieval_factory, params):
+		"""
+		A retrieval model that runs in a separate process and is called through a local RPC over a Unix socket. It is a
+		local stand-in for a remote shard server, e.g., for running each shard of a ShardedRetrieval in its own process.
+		Each client process (e.g., each action worker) opens its own connection.
+
+		Args:
+			retrieval_factory(callable): A function that gets params and returns the Retrieval object. It is called in
+			the server process.
+			params(dict): A dict of parameters passed to retrieval_factory. The parameter 'logger' is required.
+		"""
+		super().__init__({'query_generation': None, 'logger': params['logger']})
+		self.address = os.path.join(tempfile.gettempdir(), 'macaw-retrieval-%s' % uuid.uuid4().hex)
+		self.authkey = os.urandom(16)
+		self.conn = None
+		self.conn_pid = None
+		self.lock = threading.Lock()
+		context = multiprocessing.get_context('fork')
+		ready = context.Event()
+		self.process = context.Process(target=serve_retrieval,
+									   args=[retrieval_factory, params, self.address, self.authkey, ready],
+									   daemon=True)
+		self.process.start()
+		while not ready.wait(1):
+			if not self.process.is_alive():
+				raise Exception('The retrieval server process failed to start!')
+		self.store_retrieved_docs = self.call('__getattribute__', 'store_retrieved_docs')
+
+	def call(self, method, *args):
+		with self.lock:
+			if self.conn is None or self.conn_pid != os.getpid():
+				self.conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+				self.conn_pid = os.getpid()
+			self.conn.send((method, args))
+			status, result = self.conn.recv()
+		if status == 'error':
+			raise Exception('The retrieval server failed:\n' + result)
+		return result
+
+	def retrieve(self, query):
+		return self.call('retrieve', query)
+
+	def retrieve_ids(self, query):
+		return self.call('retrieve_ids', query)
+
+	def retrieve_many(self, queries):
+		return self.call('retrieve_many', queries)
+
+	def get_docs(self, doc_ids):
+		return self.call('get_docs', doc_ids)
+
+	def get_doc_from_index(self, doc_id):
+		return self.call('get_doc_from_index', doc_id)
+
+	def close(self):
+		"""
+		Stops the server process.
+		"""
+		self.process.terminate()
+		self.process.join()
+		if os.path.exists(self.address):
+			os.remove(self.address)
@@ -0,0 +1,126 @@
+"""
+Compact, lazily loaded vocabulary statistics of an Indri index.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class IndriVocabulary:
+    def __init__(self, index, index_path, cache_dir=None):
+        """
+        The vocabulary of an Indri index, i.e., the terms and their document frequencies and collection term
+        frequencies, indexed by term ID. Pyndri returns these statistics as Python dicts, which take minutes and
+        gigabytes to build for a large index. This class loads them only when they are first used, and stores them in
+        numpy arrays: the terms are concatenated in one UTF-8 buffer with an offset array, and term to ID lookups use a
+        binary search over the term IDs sorted by term. If cache_dir is given, the arrays are saved there the first time
+        and are memory-mapped afterwards, so the following restarts do not call pyndri at all and the pages are shared
+        by all processes. The cache is rebuilt if the index changes.
+
+        Args:
+            index(pyndri.Index): The Indri index.
+            index_path(str): The path to the Indri index.
+            cache_dir(str): The directory of the on-disk cache. This parameter is optional.
+        """
+        self.index = index
+        self.index_path = index_path
+        self.cache_dir = cache_dir
+        self.arrays = None
+        self.lock = threading.Lock()
+
+    def get_index_version(self):
+        manifest_path = os.path.join(self.index_path, 'manifest')
+        path = manifest_path if os.path.exists(manifest_path) else self.index_path
+        return {'index': os.path.abspath(self.index_path), 'mtime': os.path.getmtime(path)}
+
+    def get_arrays(self):
+        if self.arrays is None:
+            with self.lock:
+                if self.arrays is None:
+                    self.arrays = self.load()
+        return self.arrays
+
+    def load(self):
+        if self.cache_dir is not None:
+            meta_path = os.path.join(self.cache_dir, 'meta.json')
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    if json.load(f) == self.get_index_version():
+                        return {name: np.load(os.path.join(self.cache_dir, name + '.npy'), mmap_mode='r')
+                                for name in ['terms', 'offsets', 'sorted_ids', 'df', 'tf']}
+
+        term2id, id2term, id2df = self.index.get_dictionary()
+        id2tf = self.index.get_term_frequencies()
+        size = max(id2term) + 1 if len(id2term) > 0 else 1  # term IDs start from 1
+        encoded_terms = [id2term[term_id].encode('UTF-8') if term_id in id2term else b'' for term_id in range(size)]
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+        arrays = {'terms': np.frombuffer(b''.join(encoded_terms), dtype=np.uint8),
+                  'offsets': offsets,
+                  'sorted_ids': np.array(sorted(id2term, key=lambda term_id: encoded_terms[term_id]), dtype=np.int64),
+                  'df': np.array([id2df[term_id] if term_id in id2df else 0 for term_id in range(size)],
+                                 dtype=np.int64),
+                  'tf': np.array([id2tf[term_id] if term_id in id2tf else 0 for term_id in range(size)],
+                                 dtype=np.int64)}
+        del term2id, id2term, id2df, id2tf, encoded_terms
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            meta_path = os.path.join(self.cache_dir, 'meta.json')
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            for name in arrays:
+                np.save(os.path.join(self.cache_dir, name + '.npy'), arrays[name])
+            with open(meta_path, 'w') as f:
+                json.dump(self.get_index_version(), f)  # written last, so a partial cache is never used
+        return arrays
+
+    def __len__(self):
+        return len(self.get_arrays()['sorted_ids'])
+
+    def get_encoded_term(self, term_id):
+        arrays = self.get_arrays()
+        return arrays['terms'][arrays['offsets'][term_id]:arrays['offsets'][term_id + 1]].tobytes()
+
+    def id_to_term(self, term_id):
+        """
+        Returns the term of a term ID, or None if the ID does not exist.
+        """
+        offsets = self.get_arrays()['offsets']
+        if term_id <= 0 or term_id >= len(offsets) - 1 or offsets[term_id] == offsets[term_id + 1]:
+            return None
+        return self.get_encoded_term(term_id).decode('UTF-8')
+
+    def term_to_id(self, term):
+        """
+        Returns the ID of a term, or None if the term is not in the vocabulary.
+        """
+        encoded_term = term.encode('UTF-8')
+        sorted_ids = self.get_arrays()['sorted_ids']
+        low, high = 0, len(sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_encoded_term(sorted_ids[middle]) < encoded_term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(sorted_ids) and self.get_encoded_term(sorted_ids[low]) == encoded_term:
+            return int(sorted_ids[low])
+        return None
+
+    def get_df(self, term_id):
+        """
+        Returns the document frequency of a term ID.
+        """
+        return int(self.get_arrays()['df'][term_id])
+
+    def get_tf(self, term_id):
+        """
+        Returns the collection term frequency of a term ID.
+        """
+        return int(self.get_arrays()['tf'][term_id])
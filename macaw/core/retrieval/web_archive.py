@@ -0,0 +1,156 @@
+"""
+Recording and replaying the HTTP traffic of Web retrieval, for offline and deterministic experiments.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+import random
+import time
+import zlib
+
+from requests.adapters import HTTPAdapter
+
+from macaw.core.retrieval.cache import SqliteCache
+
+# The headers that describe the transfer rather than the content. They are not recorded, because the recorded body is
+# already decoded and the replay server sends it in one piece.
+TRANSFER_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive']
+ORIGINAL_URL_HEADER = 'X-Macaw-Original-URL'
+
+
+class WebArchive:
+    def __init__(self, path, read_only=False):
+        """
+        An archive of HTTP responses, keyed by the request method and URL. It is stored in a SQLite database file (see
+        core.retrieval.cache.SqliteCache) with compressed bodies, so that all processes can record into the same
+        archive. The request headers (e.g., the API keys) are not recorded.
+
+        Args:
+            path(str): The path to the archive file.
+            read_only(bool): Whether the archive is opened read-only, e.g., for replaying.
+        """
+        self.store = SqliteCache(path, 1 << 62, read_only=read_only)
+
+    def record(self, method, url, status, headers, body):
+        """
+        Adds a response to the archive. An earlier response to the same request is replaced.
+        """
+        headers = dict((name, value) for name, value in headers.items() if name.lower() not in TRANSFER_HEADERS)
+        self.store.put(method + ' ' + url, (status, headers, zlib.compress(body)))
+
+    def lookup(self, method, url):
+        """
+        Returns the recorded response to a request as a tuple of the status code, the headers, and the body, or None
+        if the request is not in the archive.
+        """
+        response = self.store.get(method + ' ' + url)
+        if response is None:
+            return None
+        status, headers, body = response
+        return status, headers, zlib.decompress(body)
+
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, archive, **kwargs):
+        """
+        A transport adapter for requests.Session that sends the requests to the Web and records the responses in a
+        WebArchive. The whole body of each response is read, so limits on the downloaded size are applied only after
+        the download.
+
+        Args:
+            archive(WebArchive): The archive.
+            **kwargs: The arguments of requests.adapters.HTTPAdapter, e.g., pool_maxsize.
+        """
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code != 304:  # a revalidation response should not replace the recorded page
+            self.archive.record(request.method, request.url, response.status_code, response.headers, response.content)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, server_url, **kwargs):
+        """
+        A transport adapter for requests.Session that sends all the requests to a replay server (see
+        start_replay_server) instead of the Web. The original URL is sent in a request header.
+
+        Args:
+            server_url(str): The URL of the replay server, e.g., 'http://127.0.0.1:8000'.
+            **kwargs: The arguments of requests.adapters.HTTPAdapter, e.g., pool_maxsize.
+        """
+        super().__init__(**kwargs)
+        self.server_url = server_url
+
+    def send(self, request, **kwargs):
+        url = request.url
+        request = request.copy()
+        request.url = self.server_url + '/replay'
+        request.headers[ORIGINAL_URL_HEADER] = url
+        kwargs['proxies'] = None
+        response = super().send(request, **kwargs)
+        response.url = url
+        return response
+
+
+def serve_archive(archive_path, latency, latency_jitter, seed, conn):
+    """
+    The main function of the replay server process. It sends the port of the server through conn.
+    """
+    archive = WebArchive(archive_path, read_only=True)
+    rand = random.Random(seed)
+
+    class ReplayRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive connections, like most Web servers
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            response = archive.lookup(self.command, self.headers.get(ORIGINAL_URL_HEADER, ''))
+            time.sleep(latency + rand.uniform(0, latency_jitter))
+            if response is None:
+                status, headers, body = 404, {}, b'The request is not in the Web archive.'
+            else:
+                status, headers, body = response
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReplayRequestHandler)
+    server.daemon_threads = True
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+def start_replay_server(archive_path, latency=0., latency_jitter=0., seed=0):
+    """
+    Starts a local HTTP server in a separate process that replays the responses of a WebArchive. Each response is
+    delayed by latency plus a random value between 0 and latency_jitter seconds, to simulate the Web. The requests
+    that are not in the archive get '404 Not Found'.
+
+    Args:
+        archive_path(str): The path to the archive file.
+        latency(float): The injected latency of each response (in seconds).
+        latency_jitter(float): The maximum random latency added to each response (in seconds).
+        seed(int): The seed of the random latency.
+
+    Returns:
+        A tuple of the server process and the server URL.
+    """
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=serve_archive,
+                              args=[archive_path, latency, latency_jitter, seed, child_conn], daemon=True)
+    process.start()
+    if not parent_conn.poll(30):
+        raise Exception('The replay server failed to start!')
+    return process, 'http://127.0.0.1:%d' % parent_conn.recv()
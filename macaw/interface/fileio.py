@@ -16,8 +16,14 @@ class FileioInterface(Interface):
         self.msg_id = int(time.time())
 
     def run(self):
+        """
+        Reads the input file and writes the responses to the output file, in the same order. If the CIS application
+        provides a batch request handler, the conversations are handled in batches of 'batch_size' (default: 1).
+        """
+        batch_size = self.params['batch_size'] if 'batch_size' in self.params else 1
         output_file = open(self.params['output_file_path'], 'w+')
         with open(self.params['input_file_path']) as input_file:
+            batch = []  # list of (qid, conv_list)
             for line in input_file:
                 str_list = line.strip().split('\t')
                 if len(str_list) < 2:
@@ -38,10 +44,29 @@ class FileioInterface(Interface):
                                   timestamp=-1)
                     conv_list.append(msg)
                 conv_list.reverse()
-                output_msg = self.params['experimental_request_handler'](conv_list)
-                self.result_presentation(output_msg, {'output_file': output_file, 'qid': qid})
+                batch.append((qid, conv_list))
+                if len(batch) >= batch_size:
+                    self.handle_batch(batch, output_file)
+                    batch = []
+            if len(batch) > 0:
+                self.handle_batch(batch, output_file)
         output_file.close()
 
+    def handle_batch(self, batch, output_file):
+        """
+        Sends a batch of conversations to the request handler and writes the responses in the input order.
+
+        Args:
+            batch(list): A list of (qid, conv_list) tuples.
+            output_file(file): The output file.
+        """
+        if 'experimental_batch_request_handler' in self.params and len(batch) > 1:
+            output_msgs = self.params['experimental_batch_request_handler']([conv_list for (qid, conv_list) in batch])
+        else:
+            output_msgs = [self.params['experimental_request_handler'](conv_list) for (qid, conv_list) in batch]
+        for ((qid, conv_list), output_msg) in zip(batch, output_msgs):
+            self.result_presentation(output_msg, {'output_file': output_file, 'qid': qid})
+
     def result_presentation(self, output_msg, params):
         qid = params['qid']
         output_file = params['output_file']
@@ -5,11 +5,18 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
 from abc import ABC, abstractmethod
+import asyncio
+import threading
+import traceback
+
+from macaw import util
 
 
 class Interface(ABC):
     def __init__(self, params):
         self.params = params
+        self.event_loop = None
+        self.event_loop_lock = threading.Lock()
 
     @abstractmethod
     def run(self):
@@ -17,4 +24,45 @@ class Interface(ABC):
 
     @abstractmethod
     def result_presentation(self, response_msg, params):
-        pass
\ No newline at end of file
+        pass
+
+    async def result_presentation_async(self, response_msg, params):
+        await util.run_in_executor(self.result_presentation, response_msg, params)
+
+    def is_async(self):
+        """
+        Returns whether the messages are handled in the async mode, i.e., the 'async_dispatch' parameter is set.
+        """
+        return 'async_dispatch' in self.params and self.params['async_dispatch']
+
+    def get_event_loop(self):
+        """
+        Returns the event loop of the async mode. It runs in a daemon thread, which is started on the first call.
+        """
+        with self.event_loop_lock:
+            if self.event_loop is None:
+                self.event_loop = asyncio.new_event_loop()
+                threading.Thread(target=self.event_loop.run_forever, daemon=True).start()
+            return self.event_loop
+
+    def submit_request_async(self, msg, params):
+        """
+        Handles a message in the async mode. The message is sent to the CIS by 'live_request_handler_async' on the
+        event loop and the response is presented by 'result_presentation_async'. This method does not wait for the
+        response, so the interface can receive the next messages while the earlier ones are being handled.
+
+        Args:
+            msg(Message): The message received from the user.
+            params(dict): The parameters passed to 'result_presentation_async'.
+
+        Returns:
+            A concurrent.futures.Future that is done when the response has been presented.
+        """
+        return asyncio.run_coroutine_threadsafe(self.handle_request_async(msg, params), self.get_event_loop())
+
+    async def handle_request_async(self, msg, params):
+        try:
+            response_msg = await self.params['live_request_handler_async'](msg)
+            await self.result_presentation_async(response_msg, params)
+        except Exception:
+            traceback.print_exc()
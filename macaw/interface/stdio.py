@@ -36,8 +36,14 @@ class StdioInterface(Interface):
                               msg_info=msg_info,
                               text=request,
                               timestamp=util.current_time_in_milliseconds())
-                output = self.params['live_request_handler'](msg)
-                self.result_presentation(output, {})
+                if self.is_async():
+                    self.submit_request_async(msg, {}).result()
+                elif 'progressive_response' in self.params and self.params['progressive_response']:
+                    self.params['live_progressive_request_handler'](msg,
+                                                                    lambda output: self.result_presentation(output, {}))
+                else:
+                    output = self.params['live_request_handler'](msg)
+                    self.result_presentation(output, {})
             except Exception as ex:
                 traceback.print_exc()
 
@@ -76,8 +76,7 @@ class TelegramBot(Interface):
                           msg_info=msg_info,
                           text=update.message.text,
                           timestamp=util.current_time_in_milliseconds())
-            output = self.params['live_request_handler'](msg)
-            self.result_presentation(output, {'update': update})
+            self.send_request(msg, update)
         except Exception:
             traceback.print_exc()
 
@@ -103,8 +102,7 @@ class TelegramBot(Interface):
                           msg_info=msg_info,
                           text=text,
                           timestamp=util.current_time_in_milliseconds())
-            output = self.params['live_request_handler'](msg)
-            self.result_presentation(output, {'update': update})
+            self.send_request(msg, update)
         except Exception:
             traceback.print_exc()
 
@@ -125,11 +123,24 @@ class TelegramBot(Interface):
                           msg_info=msg_info,
                           text=update.callback_query.data,
                           timestamp=util.current_time_in_milliseconds())
-            output = self.params['live_request_handler'](msg)
-            self.result_presentation(output, {'update': update})
+            self.send_request(msg, update)
         except Exception as ex:
             traceback.print_exc()
 
+    def send_request(self, msg, update):
+        """This method sends the user's message to the CIS and presents the response(s). If 'progressive_response' is
+        set, each response is sent as soon as it is ready, e.g., the retrieval results followed by the answer. If
+        'async_dispatch' is set, the message is handled on the event loop of the async mode and this method returns
+        immediately, so the messages of many users are handled concurrently."""
+        if self.is_async():
+            self.submit_request_async(msg, {'update': update})
+        elif 'progressive_response' in self.params and self.params['progressive_response']:
+            self.params['live_progressive_request_handler'](
+                msg, lambda output: self.result_presentation(output, {'update': update}))
+        else:
+            output = self.params['live_request_handler'](msg)
+            self.result_presentation(output, {'update': update})
+
     def result_presentation(self, response_msg, params):
         """This method produces an appropriate response to be sent to the client."""
         try:
@@ -6,8 +6,10 @@ Authors: Hamed Zamani (hazamani@microsoft.com)
 
 from macaw.cis import CIS
 from macaw.core import mrc, retrieval
-from macaw.core.input_handler.action_detection import RequestDispatcher
+from macaw.core.input_handler.action_detection import AsyncRequestDispatcher, HybridRequestDispatcher, \
+    RequestDispatcher
 from macaw.core.output_handler import naive_output_selection
+from macaw.util import tracing
 from macaw.util.logging import Logger
 
 
@@ -29,7 +31,14 @@ class ConvQA(CIS):
         self.retrieval = retrieval.get_retrieval_model(params=self.params)
         self.qa = mrc.get_mrc_model(params=self.params)
         self.params['actions'] = {'retrieval': self.retrieval, 'qa': self.qa}
-        self.request_dispatcher = RequestDispatcher(self.params)
+        if 'intent_scorer' in self.params and self.params['intent_scorer'] is not None:
+            self.request_dispatcher = HybridRequestDispatcher(self.params)
+        else:
+            self.request_dispatcher = RequestDispatcher(self.params)
+        if 'async_dispatch' in self.params and self.params['async_dispatch']:
+            self.async_request_dispatcher = AsyncRequestDispatcher(self.params)
+        else:
+            self.async_request_dispatcher = None
         self.output_selection = naive_output_selection.NaiveOutputProcessing({})
 
     def request_handler_func(self, conv_list):
@@ -45,8 +54,56 @@ class ConvQA(CIS):
             output_msg(Message): Returns an output message that should be sent to the UI to be presented to the user.
         """
         self.logger.info(conv_list)
-        dispatcher_output = self.request_dispatcher.dispatch(conv_list)
-        output_msg = self.output_selection.get_output(conv_list, dispatcher_output)
+        with tracing.span('dispatcher.dispatch'):
+            dispatcher_output = self.request_dispatcher.dispatch(conv_list)
+        with tracing.span('output_selection.get_output'):
+            output_msg = self.output_selection.get_output(conv_list, dispatcher_output)
+        return output_msg
+
+    def progressive_request_handler_func(self, conv_list, output_callback):
+        """
+        This function sends a response as soon as the output selection changes its choice, e.g., the retrieval results
+        are sent first and then the answer produced by the MRC model. So, the time to the first response is the
+        retrieval latency.
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+            output_callback(callable): A function that is called with each response Message.
+        """
+        self.logger.info(conv_list)
+        candidate_outputs = dict()
+        selected_actions = []
+
+        def on_result(action, result):
+            candidate_outputs[action] = result
+            selected_action = self.output_selection.output_selection(conv_list, candidate_outputs)
+            if selected_action is not None and selected_action not in selected_actions:
+                selected_actions.append(selected_action)
+                output_callback(self.output_selection.get_output(conv_list, dict(candidate_outputs)))
+
+        with tracing.span('dispatcher.dispatch'):
+            dispatcher_output = self.request_dispatcher.dispatch(conv_list, result_callback=on_result)
+        if len(selected_actions) == 0:  # commands and requests without any result.
+            output_callback(self.output_selection.get_output(conv_list, dispatcher_output))
+
+    async def request_handler_func_async(self, conv_list):
+        """
+        The async counterpart of 'request_handler_func', which uses the asyncio request dispatcher. It is used in the
+        async mode of the interfaces ('async_dispatch').
+
+        Args:
+            conv_list(list): List of util.msg.Message, each corresponding to a conversational message from / to the
+            user. This list is in reverse order, meaning that the first elements is the last interaction made by user.
+
+        Returns:
+            output_msg(Message): Returns an output message that should be sent to the UI to be presented to the user.
+        """
+        self.logger.info(conv_list)
+        with tracing.span('dispatcher.dispatch'):
+            dispatcher_output = await self.async_request_dispatcher.dispatch(conv_list)
+        with tracing.span('output_selection.get_output'):
+            output_msg = await self.output_selection.get_output_async(conv_list, dispatcher_output)
         return output_msg
 
     def run(self):
@@ -59,6 +116,11 @@ class ConvQA(CIS):
 if __name__ == '__main__':
     basic_params = {'timeout': 15,  # timeout is in terms of second.
                     'mode': 'live',  # mode can be either live or exp.
+                    'num_action_workers': 4,  # number of long-lived processes that run the actions.
+                    'action_cache_size': 0,  # number of cached results of cacheable actions (0 disables caching).
+                    'intent_scorer': None,  # 'question' to skip QA for non-questions, or None to run all actions.
+                    'tracing_sink': None,  # per-stage latency tracing: None (disabled), 'memory', or 'jsonl'.
+                    'tracing_file': None,  # the output file of the 'jsonl' tracing sink.
                     'logger': Logger({})}  # for logging into file, pass the filepath to the Logger class.
 
     # These are required database parameters if the mode is 'live'. The host and port of the machine hosting the
@@ -71,6 +133,8 @@ if __name__ == '__main__':
     interface_params = {'interface': 'telegram',  # interface can be 'telegram' or 'stdio' for live mode, and 'fileio'
                                                   # for exp mode.
                         'bot_token': 'YOUR_TELECGRAM_BOT_TOKEN',  # Telegram bot token.
+                        'progressive_response': False,  # True, to send the retrieval results before the QA answer.
+                        'async_dispatch': False,  # True, to handle concurrent requests on an asyncio event loop.
                         'asr_model': 'google',  # The API used for speech recognition.
                         'asg_model': 'google',  # The API used for speech generation.
                         'google-speech-to-text-credential-file': 'YOUR_GOOGLE_CREDENTIAL_FILE'}
@@ -78,11 +142,41 @@ if __name__ == '__main__':
     # These are parameters used by the retrieval model.
     retrieval_params = {'query_generation': 'simple',  # the model that generates a query from a conversation history.
                         'use_coref': True,  # True, if query generator can use coreference resolution, otherwise False.
-                        'search_engine': 'bing',  # the search engine. It can be either 'indri' or 'bing'.
+                        'search_engine': 'bing',  # the search engine. It can be 'indri', 'bing', or 'native'.
                         'bing_key': 'YOUR_BING_SUBSCRIPTION_KEY',  # Bing API key
+                        'bing_max_qps': 3,  # The maximum number of Bing API calls per second (of all processes).
+                        'bing_max_wait': 5,  # The maximum time that a Bing API call waits for the rate limiter.
+                        'http_cache_path': None,  # The SQLite file of the Bing HTTP cache. None disables it.
+                        'http_cache_read_only': False,  # Whether to replay the Bing HTTP cache without any requests.
+                        'web_archive_mode': None,  # Record ('record') or replay ('replay') the Bing HTTP traffic.
+                        'web_archive_path': 'PATH_TO_WEB_ARCHIVE',  # The SQLite file of the recorded Bing traffic.
+                        'replay_latency': 0.,  # The latency injected into each replayed Bing response (in seconds).
+                        'bing_lazy_pages': False,  # Whether to download Bing result pages only when their text is read.
+                        'fetch_timeout': 3,  # The connect and read timeouts of downloading each Bing result page.
+                        'fetch_max_bytes': 1024 * 1024,  # The maximum number of bytes read from each result page.
+                        'fetch_deadline': 5,  # Result pages not downloaded in these seconds are replaced by snippets.
                         'search_engine_path': 'PATH_TO_INDRI',  # The path to the indri toolkit.
-                        'col_index': 'PATH_TO_INDRI_INDEX',  # The path to the indri index.
+                        'col_index': 'PATH_TO_INDRI_INDEX',  # The indri or native index path, or a list of shards.
+                        'score_normalization': 'minmax',  # How shard scores are merged: 'minmax', 'zscore', or 'none'.
+                        'remote_shards': False,  # Whether each index shard runs in its own process.
+                        'retrieval_model': 'bm25',  # The native search engine's model. Either 'bm25' or 'dirichlet'.
+                        'merge_interval': 60,  # Seconds between merges of the native index segments added at runtime.
+                        'max_segments': 4,  # The maximum number of on-disk segments of the native index.
                         'col_text_format': 'trectext',  # collection text format. Standard 'trectext' is only supported.
+                        # The path to the pre-cleaned document store (see retrieval.doc_store). If None, Indri uses
+                        # macaw_docs.bin in its index directory if it exists, or else runs dumpindex per document.
+                        'col_doc_store': None,
+                        'col_vocabulary_cache': None,  # The directory to cache the index vocabulary statistics in.
+                        'doc_cache': None,  # document cache: None (disabled), 'memory' (per process), or 'sqlite'.
+                        'doc_cache_path': 'PATH_TO_DOC_CACHE',  # The SQLite file of the 'sqlite' document cache.
+                        'doc_cache_max_bytes': 100 * 1024 * 1024,  # The maximum size of the document cache.
+                        'query_cache': None,  # query result cache: None (disabled), 'memory', or 'sqlite'.
+                        'query_cache_path': 'PATH_TO_QUERY_CACHE',  # The SQLite file of the 'sqlite' query cache.
+                        'query_cache_ttl': 60 * 60,  # The time to live of the cached results (in seconds).
+                        'query_cache_negative_ttl': 60,  # The time to live of the cached empty results (in seconds).
+                        'passage_mode': False,  # Whether the retrieval results are the best passages of the docs.
+                        'passage_length': 100,  # The maximum number of words in each passage.
+                        'passage_stride': 50,  # The number of words between the starts of two consecutive passages.
                         'results_requested': 3}  # Maximum number of docs that should be retrieved by search engine.
     # Note: If you want to have a re-ranking model (e.g., learning to rank), you just need to simply extend the class
     # core.retrieval.search_engine.ReRanker and implement the method 'rerank'. Then simply add a 'reranker' parameter to
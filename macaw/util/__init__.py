@@ -4,6 +4,9 @@ Some util functions.
 Authors: Hamed Zamani (hazamani@microsoft.com)
 """
 
+import asyncio
+import contextvars
+import functools
 import json
 import time
 
@@ -20,6 +23,23 @@ def current_time_in_milliseconds():
     return int(round(time.time() * 1000))
 
 
+async def run_in_executor(func, *args):
+    """
+    A method that runs a blocking function in the default executor of the running event loop, so that it does not block
+    the other coroutines. The function runs in a copy of the caller's context (e.g., the tracing request ID).
+
+    Args:
+        func(callable): The blocking function.
+        *args: The arguments passed to func.
+
+    Returns:
+        The value returned by func.
+    """
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args))
+
+
 class NLPUtil:
     def __init__(self, params):
         """
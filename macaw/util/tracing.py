@@ -0,0 +1,251 @@
+"""
+Per-stage latency tracing for the request pipeline.
+
+Authors: Hamed Zamani (hazamani@microsoft.com)
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+current_request_id = contextvars.ContextVar('current_request_id', default=None)
+current_span_buffer = contextvars.ContextVar('current_span_buffer', default=None)
+
+
+class Span:
+    def __init__(self, name, request_id, start_time, duration, pid):
+        """
+        A timed stage of a request.
+
+        Args:
+            name(str): The stage name, e.g., 'retrieval.retrieve'.
+            request_id(str): The ID of the request that the stage belongs to (if any).
+            start_time(float): The start time in seconds since the epoch.
+            duration(float): The duration in milliseconds.
+            pid(int): The ID of the process that ran the stage.
+        """
+        self.name = name
+        self.request_id = request_id
+        self.start_time = start_time
+        self.duration = duration
+        self.pid = pid
+
+    def to_dict(self):
+        return self.__dict__.copy()
+
+
+def summarize_spans(spans):
+    """
+    Computes latency statistics per stage.
+
+    Args:
+        spans(list): A list of Spans.
+
+    Returns:
+        A dict from stage name to a dict containing 'count', 'mean', 'p50', 'p95', and 'p99' (in milliseconds).
+    """
+    durations = dict()
+    for span in spans:
+        durations.setdefault(span.name, []).append(span.duration)
+
+    summary = dict()
+    for name in durations:
+        values = sorted(durations[name])
+        summary[name] = {'count': len(values), 'mean': sum(values) / len(values)}
+        for p in [50, 95, 99]:  # nearest-rank percentiles
+            summary[name]['p' + str(p)] = values[max(int(math.ceil(p / 100. * len(values))) - 1, 0)]
+    return summary
+
+
+class SpanSink(ABC):
+    @abstractmethod
+    def record(self, span):
+        """
+        Exports a finished span.
+
+        Args:
+            span(Span): The span.
+        """
+        pass
+
+    @abstractmethod
+    def summary(self):
+        """
+        Returns the per-stage latency statistics computed by 'summarize_spans'.
+        """
+        pass
+
+
+class InMemorySpanAggregator(SpanSink):
+    def __init__(self, max_spans=100000):
+        """
+        A span sink that keeps the latest spans in memory.
+
+        Args:
+            max_spans(int): The maximum number of kept spans. Older spans are dropped.
+        """
+        self.max_spans = max_spans
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def record(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                self.spans = self.spans[-self.max_spans:]
+
+    def summary(self):
+        with self.lock:
+            return summarize_spans(list(self.spans))
+
+
+class JsonlSpanSink(SpanSink):
+    def __init__(self, file_path):
+        """
+        A span sink that appends each span as a JSON line to a file.
+
+        Args:
+            file_path(str): The path to the output file.
+        """
+        self.file_path = file_path
+        self.lock = threading.Lock()
+
+    def record(self, span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self.lock:
+            with open(self.file_path, 'a') as f:
+                f.write(line)
+
+    def summary(self):
+        spans = []
+        with open(self.file_path) as f:
+            for line in f:
+                spans.append(Span(**json.loads(line)))
+        return summarize_spans(spans)
+
+
+class Tracer:
+    def __init__(self):
+        """
+        The span recorder. Without a sink, spans are not recorded. Action worker processes inherit the sink of the
+        dispatcher process, but they buffer the spans of each task and send them back to the dispatcher, which records
+        them in its own sink.
+        """
+        self.sink = None
+
+    def set_sink(self, sink):
+        self.sink = sink
+
+    def is_enabled(self):
+        return self.sink is not None
+
+    def record(self, span):
+        buffer = current_span_buffer.get()
+        if buffer is not None:
+            buffer.append(span)
+        elif self.sink is not None:
+            self.sink.record(span)
+
+    @contextmanager
+    def span(self, name):
+        if not self.is_enabled():
+            yield
+            return
+        start_time = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.record(Span(name, current_request_id.get(), start_time, duration, os.getpid()))
+
+
+tracer = Tracer()
+
+
+def configure(params):
+    """
+    Sets the span sink based on the parameters.
+
+    Args:
+        params(dict): A dict of parameters. 'tracing_sink' is optional and can be either 'memory' or 'jsonl'. The
+        parameter 'tracing_file' is required for the 'jsonl' sink.
+    """
+    if 'tracing_sink' not in params or params['tracing_sink'] is None:
+        tracer.set_sink(None)
+    elif params['tracing_sink'] == 'memory':
+        tracer.set_sink(InMemorySpanAggregator())
+    elif params['tracing_sink'] == 'jsonl':
+        tracer.set_sink(JsonlSpanSink(params['tracing_file']))
+    else:
+        raise Exception('The requested tracing sink does not exist!')
+
+
+def span(name):
+    """
+    A context manager that records the duration of the enclosed stage, e.g., with tracing.span('mrc.predict'): ...
+
+    Args:
+        name(str): The stage name.
+    """
+    return tracer.span(name)
+
+
+@contextmanager
+def request(request_id=None):
+    """
+    A context manager that assigns a request ID to all the spans recorded in the enclosed block.
+
+    Args:
+        request_id(str): The request ID. If not given, a new ID is generated.
+    """
+    token = current_request_id.set(request_id if request_id is not None else uuid.uuid4().hex)
+    try:
+        yield current_request_id.get()
+    finally:
+        current_request_id.reset(token)
+
+
+def get_request_id():
+    return current_request_id.get()
+
+
+@contextmanager
+def collect_spans():
+    """
+    A context manager that buffers the spans recorded in the enclosed block instead of exporting them, e.g., to send
+    them from a worker process to the dispatcher.
+
+    Returns:
+        The list of buffered Spans.
+    """
+    spans = []
+    token = current_span_buffer.set(spans)
+    try:
+        yield spans
+    finally:
+        current_span_buffer.reset(token)
+
+
+def record_spans(spans):
+    """
+    Exports spans collected in another process.
+
+    Args:
+        spans(list): A list of Spans.
+    """
+    for s in spans:
+        tracer.record(s)
+
+
+def summary():
+    """
+    Returns the per-stage latency statistics of the configured sink, or an empty dict if tracing is disabled.
+    """
+    return tracer.sink.summary() if tracer.sink is not None else dict()